@@ -0,0 +1,179 @@
+"""End-to-end benchmark of the mcmv and camera pipelines on synthetic fixtures.
+
+    python benchmarks/bench_pipeline.py --frames 1800 --out results.json
+    python benchmarks/bench_pipeline.py --frames 1800 --compare results.json
+
+Every stage is run --repeat times and the best wall time is kept. Results are printed and, with --out,
+written as JSON; --compare prints the change against an earlier result file of the same workload.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'filters'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mcmv.export_bedrock import BedrockModelExporter, BedrockAnimFileFormatter
+from mcmv.import_file import BvhFileLoader
+from mcmv.math_objects import Quaternion, Euler
+from mcmv.rig_profile import load_rig
+import camera
+import vmdreader
+from instrumentation import StageRecorder, max_rss_kb
+
+import fixtures
+
+RIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'rigs', 'pjsekai.json')
+# Results are only compared with a baseline of the same workload
+WORKLOAD_META = ('frames', 'joints', 'camera_keyframes', 'dispatch', 'repeat')
+
+
+class Benchmark:
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.stages = {}
+
+    def run(self, name: str, stage, frames: int, setup=None):
+        """Time stage() and record it. stage returns (result, bytes written); the last result is returned.
+        setup() is called before every run and is not timed."""
+        best = None
+        result, size = None, 0
+        start_rss = max_rss_kb()
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            result, size = stage()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        self.stages[name] = {
+            'seconds': best,
+            'frames': frames,
+            'frames_per_second': frames / best if best else None,
+            # Growth of the process' peak RSS during the stage, 0 while it stays under an earlier peak
+            'rss_growth_kb': max_rss_kb() - start_rss,
+            'output_bytes': size
+        }
+        print(f"{name:<16} {best * 1000:10.1f} ms {frames / best:12.1f} frames/s "
+              f"{self.stages[name]['rss_growth_kb']:10d} KB RSS growth {size:12d} bytes")
+        return result
+
+
+def run_benchmarks(args) -> dict:
+    with tempfile.TemporaryDirectory(prefix='mcmv_bench_') as work:
+        bvh_path = os.path.join(work, 'bench.bvh')
+        vmd_path = os.path.join(work, 'bench.vmd')
+        fixtures.write_bvh(bvh_path, args.frames, args.joints)
+        fixtures.write_vmd(vmd_path, args.camera_keyframes)
+
+        bench = Benchmark(args.repeat)
+        face_north = Quaternion().set_from_euler(Euler('xyz', 0.0, 0.0, 0.0))
+
+        def parse():
+            loader = BvhFileLoader(bvh_path, scale=0.1, order='xyz', face_north=face_north)
+            return (loader.get_model(), loader.get_animation()), os.path.getsize(bvh_path)
+
+        model, animation = bench.run('bvh_parse', parse, args.frames)
+        frames = len(animation.frames)
+
+        def load():
+            rig = load_rig(RIG_PATH)
+            return (rig, rig.minecraft_model()), os.path.getsize(RIG_PATH)
+
+        rig, minecraft_model = bench.run('rig_load', load, 1)
+
+        def retarget():
+            # The hip scaling is part of the retarget plan, there is no separate scaling pass
+            return rig.retarget_plan(model, minecraft_model).get_pose_track(model, animation), 0
+
+        track = bench.run('retarget', retarget, frames)
+
+        animation_path = os.path.join(work, 'bench.animation.json')
+
+        def export():
+            exporter = BedrockModelExporter()
+            exporter.set_model_info(model, minecraft_model, rig.translation)
+            exporter.write_pose_track(work, 'bench', BedrockAnimFileFormatter(
+                '1.8.0', 'animation.bench.bench', precision=4, sparse=True), track)
+            return None, os.path.getsize(animation_path)
+
+        bench.run('bedrock_export', export, frames)
+
+        def read_camera():
+            return vmdreader.readCamera(vmd_path), os.path.getsize(vmd_path)
+
+        keyframes = bench.run('vmd_read', read_camera, args.camera_keyframes)
+        camera_frames = keyframes[-1]['frame'] + 1 if keyframes else 0
+
+        def convert():
+            # camera.convert writes below ./BP
+            cwd = os.getcwd()
+            os.chdir(work)
+            try:
+                camera.convert(vmd_path, 'bench', args.dispatch)
+            finally:
+                os.chdir(cwd)
+            return None, StageRecorder.path_size(os.path.join(work, 'BP'))
+
+        bench.run('camera_convert', convert, camera_frames)
+
+        return {
+            'meta': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'frames': args.frames,
+                'joints': args.joints,
+                'camera_keyframes': args.camera_keyframes,
+                'dispatch': args.dispatch,
+                'repeat': args.repeat
+            },
+            'stages': bench.stages
+        }
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """Print the change of every stage. A baseline of another workload is refused, another Python or platform
+    only warned about."""
+    meta, baseline_meta = results['meta'], baseline.get('meta', {})
+    differences = [f"{key} {baseline_meta.get(key)} -> {meta[key]}" for key in WORKLOAD_META
+                   if baseline_meta.get(key) != meta[key]]
+    if differences:
+        sys.exit(f"[ERROR] The baseline ran another workload: {', '.join(differences)}")
+    for key in ('python', 'platform'):
+        if baseline_meta.get(key) != meta[key]:
+            print(f"[WARN] The baseline ran on {key} {baseline_meta.get(key)}, this run on {meta[key]}")
+
+    print(f"\n{'stage':<16} {'baseline':>12} {'current':>12} {'change':>8} {'bytes':>8}")
+    for name, stage in results['stages'].items():
+        if name not in baseline['stages']:
+            continue
+        before = baseline['stages'][name]
+        change = stage['seconds'] / before['seconds'] - 1 if before['seconds'] else 0.0
+        size = stage['output_bytes'] / before['output_bytes'] - 1 if before['output_bytes'] else 0.0
+        print(f"{name:<16} {before['seconds'] * 1000:10.1f}ms {stage['seconds'] * 1000:10.1f}ms "
+              f"{change:+8.1%} {size:+8.1%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=600, help='BVH frames (30 fps)')
+    parser.add_argument('--joints', type=int, default=len(fixtures.RIG), help='BVH joints, at least the rig')
+    parser.add_argument('--camera-keyframes', type=int, default=600, help='VMD camera keyframes')
+    parser.add_argument('--dispatch', default='tree', choices=['tree', 'linear'], help='camera dispatch')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results to compare against')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=4)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f))
@@ -0,0 +1,86 @@
+"""Check that the Java armor stand head poses match the Euler round trip they replaced.
+
+    python benchmarks/check_head_pose.py --frames 600 --random 20000
+
+The rotations of every joint of a synthetic BVH track, plus random rotations, are converted with
+JavaUtility.get_rotation, JavaUtility.get_rotations and the previous implementation. Exits with status 1
+when any Euler component differs by more than --tolerance degrees.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'filters'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mcmv.export_java import JavaUtility
+from mcmv.import_file import BvhFileLoader
+from mcmv.math_objects import Quaternion, Euler
+
+import fixtures
+
+
+def euler_round_trip(quaternion: Quaternion, rotate: Quaternion) -> Euler:
+    """The head pose as JavaUtility.get_rotation computed it before the Euler round trip was removed."""
+    rotation = Euler('zyx').set_from_quaternion(quaternion.parented(rotate).parented(Quaternion(0.0, 1.0, 0.0, 0.0)))
+    rotation.x *= -1
+    rotation.y *= -1
+    quaternion = Quaternion().set_from_euler(rotation)
+
+    # account for the fact that y angle 0 is south
+    rotation = Euler('zyx').set_from_quaternion(quaternion)
+
+    return rotation
+
+
+def random_rotation(rng: random.Random) -> Quaternion:
+    # Uniform over the rotations: a normalized 4D Gaussian
+    quaternion = Quaternion(rng.gauss(0, 1), rng.gauss(0, 1), rng.gauss(0, 1), rng.gauss(0, 1))
+    quaternion.normalize()
+    return quaternion
+
+
+def difference(a: Euler, b: Euler) -> float:
+    """Return the largest difference of the Euler components in degrees, a full turn apart being equal."""
+    return max(abs((x - y + 180) % 360 - 180) for x, y in zip(a.to_tuple(), b.to_tuple()))
+
+
+def track_rotations(frames: int) -> list[Quaternion]:
+    with tempfile.TemporaryDirectory(prefix='mcmv_check_') as work:
+        bvh_path = os.path.join(work, 'check.bvh')
+        fixtures.write_bvh(bvh_path, frames)
+        loader = BvhFileLoader(bvh_path, scale=0.1, order='xyz',
+                               face_north=Quaternion().set_from_euler(Euler('xyz', 0.0, 0.0, 0.0)))
+        loader.get_model()
+        animation = loader.get_animation()
+    return [rotation for frame in animation.frames for _, rotation in frame.joint_channels.values()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=600, help='BVH frames (30 fps)')
+    parser.add_argument('--random', type=int, default=20000, help='random rotations')
+    parser.add_argument('--tolerance', type=float, default=1e-9, help='degrees')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    quaternions = track_rotations(args.frames) + [random_rotation(rng) for _ in range(args.random)]
+    # The identity, a quarter turn around y and an arbitrary rotation
+    rotates = [Quaternion(), Quaternion(0.0, math.sqrt(0.5), 0.0, math.sqrt(0.5)), random_rotation(rng)]
+
+    worst = 0.0
+    for rotate in rotates:
+        batched = JavaUtility.get_rotations(quaternions, rotate)
+        for quaternion, pose in zip(quaternions, batched):
+            expected = euler_round_trip(quaternion, rotate)
+            worst = max(worst, difference(JavaUtility.get_rotation(quaternion, rotate), expected),
+                        difference(pose, expected))
+
+    print(f"{len(quaternions) * len(rotates)} head poses, largest difference {worst:.3g} degrees")
+    if worst > args.tolerance:
+        print(f"[ERROR] The head poses differ by more than {args.tolerance:g} degrees")
+        sys.exit(1)
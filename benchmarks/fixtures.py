@@ -0,0 +1,103 @@
+import math
+import random
+import struct
+
+# Synthetic inputs for the benchmarks: a BVH track using the joint names of data/rigs/pjsekai.json and a VMD
+# file holding only camera keyframes.
+
+RIG = [
+    ('Hip', None, (0.0, 90.0, 0.0)),
+    ('Chest', 'Hip', (0.0, 10.0, 0.0)),
+    ('Head', 'Chest', (0.0, 40.0, 0.0)),
+    ('Right_Elbow', 'Chest', (-20.0, 30.0, 0.0)),
+    ('Right_ForeArmRoll', 'Right_Elbow', (-25.0, 0.0, 0.0)),
+    ('Left_Elbow', 'Chest', (20.0, 30.0, 0.0)),
+    ('Left_ForeArmRoll', 'Left_Elbow', (25.0, 0.0, 0.0)),
+    ('Right_Knee', 'Hip', (-10.0, -40.0, 0.0)),
+    ('Right_Ankle', 'Right_Knee', (0.0, -40.0, 0.0)),
+    ('Left_Knee', 'Hip', (10.0, -40.0, 0.0)),
+    ('Left_Ankle', 'Left_Knee', (0.0, -40.0, 0.0)),
+]
+
+
+def write_bvh(path: str, frames: int, joints: int = len(RIG), seed: int = 1, frame_time: float = 1 / 30) -> None:
+    """Write a BVH file of `frames` frames. Joints beyond the rig are added as a finger chain under the head,
+    they are parsed and retargeted like any other joint but have no Minecraft bone."""
+    rig = list(RIG)
+    parent = 'Head'
+    for i in range(max(joints - len(RIG), 0)):
+        rig.append((f'Extra_{i}', parent, (0.0, 2.0, 0.0)))
+        parent = f'Extra_{i}'
+
+    children = {}
+    for name, parent, offset in rig:
+        children.setdefault(parent, []).append((name, offset))
+
+    lines = ['HIERARCHY']
+    order = []
+
+    def emit(name, offset, depth):
+        indent = '\t' * depth
+        lines.append(indent + ('ROOT ' if depth == 0 else 'JOINT ') + name)
+        lines.append(indent + '{')
+        lines.append(indent + '\tOFFSET %f %f %f' % offset)
+        if depth == 0:
+            lines.append(indent + '\tCHANNELS 6 Xposition Yposition Zposition Zrotation Xrotation Yrotation')
+        else:
+            lines.append(indent + '\tCHANNELS 3 Zrotation Xrotation Yrotation')
+        order.append(name)
+        if name not in children:
+            lines.append(indent + '\tEnd Site')
+            lines.append(indent + '\t{')
+            lines.append(indent + '\t\tOFFSET 0.000000 5.000000 0.000000')
+            lines.append(indent + '\t}')
+        for child, child_offset in children.get(name, []):
+            emit(child, child_offset, depth + 1)
+        lines.append(indent + '}')
+
+    emit(rig[0][0], rig[0][2], 0)
+
+    lines.append('MOTION')
+    lines.append('Frames: %d' % frames)
+    lines.append('Frame Time: %f' % frame_time)
+    rnd = random.Random(seed)
+    phases = [rnd.random() * 6 for _ in order]
+    for frame in range(frames):
+        t = frame * frame_time
+        values = [math.sin(t) * 5, 90 + math.sin(t * 2), math.cos(t) * 3]
+        for phase in phases:
+            values += [40 * math.sin(t + phase), 170 * math.sin(t * 0.7 + phase), 60 * math.cos(t * 1.3 + phase)]
+        lines.append(' '.join('%.4f' % x for x in values))
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_vmd(path: str, keyframes: int, step: int = 3, seed: int = 1) -> None:
+    """Write a VMD file with `keyframes` camera keyframes every `step` frames (30 fps), and every other
+    section empty. The light and shadow counts are written too, vmdreader expects them."""
+    rnd = random.Random(seed)
+    data = bytearray(b'Vocaloid Motion Data 0002'.ljust(30, b'\0'))
+    data += b'camera'.ljust(20, b'\0')
+    data += struct.pack('<I', 0)  # bones
+    data += struct.pack('<I', 0)  # morphs
+
+    data += struct.pack('<I', keyframes)
+    for i in range(keyframes):
+        t = i * step / 30
+        location = (math.sin(t) * 10, 10 + math.sin(t * 0.5) * 2, math.cos(t) * 10)
+        rotation = (0.2 * math.sin(t * 0.3), t * 0.1 + rnd.random() * 0.01, 0.0)
+        data += struct.pack('<I', i * step)
+        data += struct.pack('<f', -45.0)
+        data += struct.pack('<3f', *location)
+        data += struct.pack('<3f', *rotation)
+        data += bytes([20, 107] * 12)
+        data += struct.pack('<I', 30)
+        data += struct.pack('<B', 0)
+
+    data += struct.pack('<I', 0)  # lights
+    data += struct.pack('<I', 0)  # shadows
+    data += struct.pack('<I', 0)  # ik
+
+    with open(path, 'wb') as f:
+        f.write(data)
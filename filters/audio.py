@@ -0,0 +1,56 @@
+import json
+import os
+import struct
+
+# Song durations read from the OGG files of the resource pack, so timelines follow the real audio length.
+
+# An Ogg page is at most 27 + 255 + 255 * 255 bytes long
+MAX_PAGE_SIZE = 65307
+
+
+def ogg_duration(path: str) -> float:
+    """Return the duration in seconds of an Ogg Vorbis or Opus file.
+
+    The sample rate comes from the identification header in the first page and the sample count from the
+    granule position of the last page, so only the start and the end of the file are read.
+    """
+    with open(path, "rb") as f:
+        head = f.read(MAX_PAGE_SIZE)
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - MAX_PAGE_SIZE, 0))
+        tail = f.read()
+
+    if head[:4] != b"OggS":
+        raise ValueError(f"{path} is not an Ogg file")
+    segments = head[26]
+    packet = 27 + segments
+    if head[packet:packet + 7] == b"\x01vorbis":
+        sample_rate = struct.unpack_from("<I", head, packet + 12)[0]
+        pre_skip = 0
+    elif head[packet:packet + 8] == b"OpusHead":
+        # Opus granule positions always count 48 kHz samples
+        sample_rate = 48000
+        pre_skip = struct.unpack_from("<H", head, packet + 10)[0]
+    else:
+        raise ValueError(f"{path} is neither Vorbis nor Opus")
+
+    last_page = tail.rfind(b"OggS")
+    if last_page < 0:
+        raise ValueError(f"{path} has no last page")
+    granule = struct.unpack_from("<q", tail, last_page + 6)[0]
+    return (granule - pre_skip) / sample_rate
+
+
+def sound_duration(sound: str, rp_path: str = "./RP") -> float:
+    """Return the duration of the first file of a sound definition, or None if it has no OGG file."""
+    with open(os.path.join(rp_path, "sounds", "sound_definitions.json"), "r") as f:
+        definitions = json.load(f)["sound_definitions"]
+    if sound not in definitions:
+        return None
+
+    sound_file = definitions[sound]["sounds"][0]
+    name = sound_file["name"] if isinstance(sound_file, dict) else sound_file
+    path = os.path.join(rp_path, name + ".ogg")
+    if not os.path.exists(path):
+        return None
+    return ogg_duration(path)
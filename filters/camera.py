@@ -1,14 +1,35 @@
+import bisect
 import json
 import os
+import re
+import shutil
 import sys
 import math
 import vmdreader as vmdr
 
+from mcmv import mc_search_function
 
-def convert(path, song=""):
+
+def convert(path, song="", dispatch="tree", catch_up_ease=0.25, segment_seconds=None, cost_model=None):
+    """Convert the camera of a VMD file into BP/functions/songs/{song}/camera.mcfunction.
+
+    The function is run as each player whose {song} score is 1 or more, and advances that score by one every tick.
+    With dispatch="tree" the camera pose for the current tick is found through a search function in camera/,
+    with dispatch="linear" every pose is checked by a line in camera.mcfunction.
+
+    With catch_up_ease, the tree also handles scores that jumped ahead (see write_tree): the pose of the new score
+    is set at once, eased over catch_up_ease seconds. None turns this off.
+
+    With segment_seconds, the poses are split into one set of function files per segment_seconds of the song,
+    and camera.mcfunction only enters the segment of the current score.
+
+    cost_model is the SearchCostModel that shapes the trees, camera_cost_model() by default.
+    Returns the number of camera poses, one for every tick with a keyframe.
+    """
     camera = vmdr.readCamera(path)
     frames = {}
-    cmds = []
+    # score value -> camera command, run as and at the player
+    cmds = {}
     skip_easing = False
     for i in range(len(camera)):
         frame = camera[i]["frame"]
@@ -56,21 +77,133 @@ def convert(path, song=""):
         z += z2
 
         # cmd = f"execute as @a if score @s villain matches {tick + 1} positioned as @e[type=pj:song_manager,c=1] rotated as @e[type=pj:song_manager,c=1] positioned ~~~ positioned ^^^10 run camera @s set minecraft:free ease 0.1 linear pos ~{x}~{y}~{z} rot ~{rotX:f}~{rotY:f}"
-        cmd = f"execute as @a if score @s {song} matches {tick + 1} positioned as @e[type=pj:song_manager,c=1] rotated as @e[type=pj:song_manager,c=1] positioned ~~-0.8~ positioned ^^^9 positioned ~{x:f}~{y:f}~{z:f} rotated ~{rotX:f} ~{rotY:f} run camera @s set minecraft:free ease 0.1 linear pos ^^^ rot {rotX:f} {rotY:f}"
+        cmd = f"positioned as @e[type=pj:song_manager,c=1] rotated as @e[type=pj:song_manager,c=1] positioned ~~-0.8~ positioned ^^^9 positioned ~{x:f}~{y:f}~{z:f} rotated ~{rotX:f} ~{rotY:f} run camera @s set minecraft:free ease 0.1 linear pos ^^^ rot {rotX:f} {rotY:f}"
         if skip_easing:
             skip_easing = False
             cmd = cmd.replace("ease 0.1 linear", "")
-        cmds.append(cmd)
+        cmds[tick + 1] = cmd
 
     fr = list(frames.keys())[-1]
-    for j in range(fr + 1, 0, -1):
-        cmd = f"execute as @a if score @s {song} matches {j} run scoreboard players set @s {song} {j + 1}"
-        cmds.append(cmd)
 
-    cmds = "\n".join(cmds)
     os.makedirs(f"./BP/functions/songs/{song}", exist_ok=True)
+    segment_size = round(segment_seconds * 20) if segment_seconds else None
+    if dispatch == "linear":
+        lines = write_linear(cmds, song, fr, segment_size)
+    else:
+        lines = write_tree(cmds, song, fr, catch_up_ease, segment_size, cost_model or camera_cost_model())
+
     with open(f"./BP/functions/songs/{song}/camera.mcfunction", "w") as f:
-        f.write(cmds)
+        f.write("\n".join(lines))
+    return len(cmds)
+
+
+def camera_cost_model():
+    """Return the cost model of the camera trees. On villain, a file_weight of 0.02 takes the pose tree from 1083
+    to 964 files for 0.4 more commands per tick on average and one less at most. Higher weights start to trade
+    whole commands per tick for files."""
+    return mc_search_function.SearchCostModel(file_weight=0.02, line_weight=0.001)
+
+
+def get_runs(cmds):
+    """Return (first tick, last tick, command) for every run of consecutive ticks with the same command."""
+    runs = []
+    for tick in sorted(cmds):
+        if runs and runs[-1][1] == tick - 1 and runs[-1][2] == cmds[tick]:
+            runs[-1] = (runs[-1][0], tick, cmds[tick])
+        else:
+            runs.append((tick, tick, cmds[tick]))
+    return runs
+
+
+def write_linear(cmds, song, fr, segment_size=None):
+    """Return the lines of a camera function that checks every pose in turn.
+
+    With segment_size, the checks of every segment_size ticks are written to their own file in camera/ and the
+    returned lines only pick the segment of the current score.
+    """
+    def segment(tick):
+        return (tick - 1) // segment_size if segment_size else 0
+
+    segments = {}
+    for first, last, cmd in get_runs(cmds):
+        # A hold crossing a segment boundary is checked in both segments
+        while first <= last:
+            end = min(last, (segment(first) + 1) * segment_size) if segment_size else last
+            ticks = str(first) if first == end else f"{first}..{end}"
+            segments.setdefault(segment(first), []).append(f"execute if score @s {song} matches {ticks} {cmd}")
+            first = end + 1
+
+    for j in range(fr + 1, 0, -1):
+        segments.setdefault(segment(j), []).append(
+            f"execute if score @s {song} matches {j} run scoreboard players set @s {song} {j + 1}")
+
+    if not segment_size:
+        return segments.get(0, [])
+
+    mc_search_function.write_function_files(f"./BP/functions/songs/{song}/camera",
+                                            {f"segment{k}": lines for k, lines in segments.items()})
+    print(f"[INFO] {song} camera: {len(segments)} segments, {max(len(x) for x in segments.values())} commands "
+          f"in the largest")
+    # Last segment first, so a segment that moves the score into the next one does not run that one too
+    return [
+        f"execute if score @s {song} matches {k * segment_size + 1}..{(k + 1) * segment_size} "
+        f"run function songs/{song}/camera/segment{k}" for k in sorted(segments, reverse=True)
+    ]
+
+
+def catch_up_command(cmd, ease):
+    """Return cmd with its easing replaced by a linear ease of ease seconds."""
+    return re.sub(r"minecraft:free\s+(?:ease \S+ \S+ )?", f"minecraft:free ease {ease} linear ", cmd)
+
+
+def write_tree(cmds, song, fr, catch_up_ease=None, segment_size=None, cost_model=None):
+    """Write a search function for the poses into camera/ and return the lines of the camera function calling it.
+
+    With catch_up_ease, {song}_gap holds how far the score moved since the last tick ({song}_last). A normal step
+    (a gap of 1 or less) runs the pose tree. After a jump (a gap of 2 or more) a second tree in camera/catch_up/
+    sets the latest pose at or before the new score even if that score has no pose of its own, eased over
+    catch_up_ease seconds, so a player that fell behind does not replay the skipped poses.
+    """
+    cost_model = cost_model or camera_cost_model()
+
+    def command(tick):
+        return f"execute {cmds[tick]}" if tick in cmds else None
+
+    stats = mc_search_function.create_search_function(
+        f"./BP/functions/songs/{song}/camera", f"songs/{song}/camera", f"@s {song}",
+        command, (1, fr + 1), divisions=cost_model, segment_size=segment_size)
+    print(f"[INFO] {song} camera: {stats.files} function files, {stats.expected_commands:.1f} commands per tick on "
+          f"average, {stats.max_commands} at most")
+
+    catch_up_path = f"./BP/functions/songs/{song}/camera/catch_up"
+    if catch_up_ease is None:
+        shutil.rmtree(catch_up_path, ignore_errors=True)
+        return [
+            f"function songs/{song}/camera/main",
+            f"execute if score @s {song} matches ..{fr + 1} run scoreboard players add @s {song} 1"
+        ]
+
+    ticks = sorted(cmds)
+
+    def catch_up(tick):
+        i = bisect.bisect_right(ticks, tick) - 1
+        # Ticks from a pose to the next one share one command, so they collapse into a single range leaf
+        return f"execute {catch_up_command(cmds[ticks[i]], catch_up_ease)}" if i >= 0 else None
+
+    catch_up_stats = mc_search_function.create_search_function(
+        catch_up_path, f"songs/{song}/camera/catch_up", f"@s {song}",
+        catch_up, (1, fr + 1), divisions=cost_model, segment_size=segment_size)
+    print(f"[INFO] {song} camera catch-up: {catch_up_stats.files} function files, "
+          f"{catch_up_stats.expected_commands:.1f} commands per jump on average")
+
+    return [
+        f"scoreboard players operation @s {song}_gap = @s {song}",
+        f"scoreboard players operation @s {song}_gap -= @s {song}_last",
+        f"execute if score @s {song}_gap matches ..1 run function songs/{song}/camera/main",
+        f"execute if score @s {song}_gap matches 2.. run function songs/{song}/camera/catch_up/main",
+        f"scoreboard players operation @s {song}_last = @s {song}",
+        f"execute if score @s {song} matches ..{fr + 1} run scoreboard players add @s {song} 1"
+    ]
 
 
 # convert("./data/mcmv/villain/camera.vmd", "villain")
@@ -0,0 +1,253 @@
+import json
+import os
+import re
+import sys
+
+from song_registry import parse_range
+
+# Static runtime cost of the generated output.
+#
+# Functions: the worst-case number of commands and target selectors one player runs per tick, starting from
+# the functions of BP/functions/tick.json and following `function` calls. Calls guarded by
+# `if score <target> <objective> matches <range>` are only followed for scores that can pass the guard, so
+# calls with disjoint ranges (search trees) cost the most expensive one, not the sum. In an exclusive entry point,
+# calls guarded on different scores never run in the same tick either, so it costs its most expensive score.
+# songs.mcfunction is exclusive once song_generator has written the start functions: songs/{song} resets the score
+# of every song, so only the camera of the song that started is dispatched. Entry points report their cost per
+# guarding score either way.
+# Animations: keyframes per second of every bone channel.
+#
+# Settings (all optional):
+#   "budget": {"commands_per_tick": 64, "selectors_per_tick": 128, "function_bytes": 65536,
+#              "keyframes_per_second": 20}
+#   "exclusive": ["songs"]      the exclusive entry points, none by default
+#   "report": "cost_report.json"
+# The filter exits with status 1 when a budget is exceeded.
+
+INF = float("inf")
+# The range of a score that is not set, no guard passes it
+UNSET = (INF, -INF)
+SELECTOR_PATTERN = re.compile(r"@[aeprsv]\b")
+GUARD_PATTERN = re.compile(r"\bif score (\S+) (\S+) matches (\S+)")
+CALL_PATTERN = re.compile(r"(?:^|\brun )function (\S+)")
+
+
+class Command:
+    def __init__(self, line: str):
+        self.selectors = len(SELECTOR_PATTERN.findall(line))
+        # Only the guards before the call restrict it
+        call = CALL_PATTERN.search(line)
+        head = line[:call.start()] if call else line
+        self.guards = [((target, objective), parse_range(matches))
+                       for target, objective, matches in GUARD_PATTERN.findall(head)]
+        self.call = call.group(1) if call else None
+
+
+class FunctionCostAnalyzer:
+    def __init__(self, path="./BP/functions/", exclusive=()):
+        self.path = path
+        self.exclusive = set(exclusive)
+        self.functions = {}
+        self.sizes = {}
+        for root, _, files in os.walk(path):
+            for file in files:
+                if not file.endswith(".mcfunction"):
+                    continue
+                file_path = os.path.join(root, file)
+                name = os.path.relpath(file_path, path)[:-len(".mcfunction")].replace(os.sep, "/")
+                with open(file_path, "r") as f:
+                    lines = [x.strip() for x in f.read().splitlines()]
+                self.functions[name] = [Command(x) for x in lines if x and not x.startswith("#")]
+                self.sizes[name] = os.path.getsize(file_path)
+
+        self._memo = {}
+        self._active = set()
+
+    def entry_points(self):
+        tick_path = os.path.join(self.path, "tick.json")
+        if not os.path.exists(tick_path):
+            return []
+        with open(tick_path, "r") as f:
+            return json.load(f).get("values", [])
+
+    def cost(self, name: str, context: dict = None) -> tuple[int, int]:
+        """Return the worst-case (commands, selectors) of running function name once, for scores in context
+        ({(target, objective): (low, high)})."""
+        context = context or {}
+        key = (name, tuple(sorted(context.items())))
+        if key in self._memo:
+            return self._memo[key]
+        if name not in self.functions or key in self._active:
+            # Missing functions run nothing, a recursive call is counted once
+            return 0, 0
+
+        self._active.add(key)
+        commands = self.functions[name]
+        total_commands = len(commands)
+        total_selectors = sum(x.selectors for x in commands)
+
+        groups = {}
+        for command in commands:
+            if command.call is None:
+                continue
+            inner = self._restrict(context, command.guards)
+            if inner is None:
+                continue
+            if not command.guards:
+                callee_commands, callee_selectors = self.cost(command.call, inner)
+                total_commands += callee_commands
+                total_selectors += callee_selectors
+            else:
+                groups.setdefault(command.guards[0][0], []).append((inner, command.call))
+
+        # Calls guarded on the same score only add up where their ranges overlap
+        for score, calls in groups.items():
+            worst_commands, worst_selectors = 0, 0
+            for segment in self._segments(context.get(score, (-INF, INF)), [x[score] for x, _ in calls]):
+                segment_commands, segment_selectors = 0, 0
+                for inner, callee in calls:
+                    low, high = inner[score]
+                    if low <= segment[0] and segment[1] <= high:
+                        callee_commands, callee_selectors = self.cost(callee, {**inner, score: segment})
+                        segment_commands += callee_commands
+                        segment_selectors += callee_selectors
+                worst_commands = max(worst_commands, segment_commands)
+                worst_selectors = max(worst_selectors, segment_selectors)
+            total_commands += worst_commands
+            total_selectors += worst_selectors
+
+        self._active.discard(key)
+        self._memo[key] = (total_commands, total_selectors)
+        return self._memo[key]
+
+    def score_costs(self, name: str) -> dict:
+        """Return {(target, objective): (commands, selectors)} of running function name once with only that score
+        set, for every score its calls are guarded on."""
+        scores = {x.guards[0][0] for x in self.functions.get(name, []) if x.call is not None and x.guards}
+        return {score: self.cost(name, {x: UNSET for x in scores if x != score}) for score in scores}
+
+    @staticmethod
+    def _restrict(context: dict, guards: list):
+        """Return context narrowed by the guards, or None if no score can pass them."""
+        inner = dict(context)
+        for score, (low, high) in guards:
+            current_low, current_high = inner.get(score, (-INF, INF))
+            low, high = max(low, current_low), min(high, current_high)
+            if low > high:
+                return None
+            inner[score] = (low, high)
+        return inner
+
+    @staticmethod
+    def _segments(interval: tuple, ranges: list) -> list:
+        """Split interval at every range bound, so each range covers a segment entirely or not at all."""
+        bounds = {interval[0], interval[1] + 1}
+        for low, high in ranges:
+            bounds.update(x for x in (low, high + 1) if interval[0] < x <= interval[1])
+        bounds = sorted(bounds)
+        return [(bounds[i], bounds[i + 1] - 1) for i in range(len(bounds) - 1)]
+
+    def report(self) -> dict:
+        ticks = {}
+        for name in self.entry_points():
+            scores = self.score_costs(name)
+            if name in self.exclusive and scores:
+                commands, selectors = max(x[0] for x in scores.values()), max(x[1] for x in scores.values())
+            else:
+                commands, selectors = self.cost(name)
+            ticks[name] = {"commands_per_tick": commands, "selectors_per_tick": selectors}
+            if scores:
+                ticks[name]["scores"] = {
+                    f"{target} {objective}": {"commands_per_tick": commands, "selectors_per_tick": selectors}
+                    for (target, objective), (commands, selectors) in sorted(scores.items())
+                }
+
+        files = {
+            name: {
+                "commands": len(commands),
+                "selectors": sum(x.selectors for x in commands),
+                "bytes": self.sizes[name]
+            } for name, commands in self.functions.items()
+        }
+        return {
+            "tick": ticks,
+            "commands_per_tick": sum(x["commands_per_tick"] for x in ticks.values()),
+            "selectors_per_tick": sum(x["selectors_per_tick"] for x in ticks.values()),
+            "files": files
+        }
+
+
+def animation_report(path="./RP/animations/") -> dict:
+    """Return the keyframes per second of every animated bone channel, per animation file."""
+    report = {}
+    for root, _, files in os.walk(path):
+        for file in sorted(files):
+            if not file.endswith(".json"):
+                continue
+            file_path = os.path.join(root, file)
+            with open(file_path, "r") as f:
+                data = json.load(f)
+
+            channels = {}
+            for identifier, animation in data.get("animations", {}).items():
+                length = animation.get("animation_length", 0) or 1
+                for bone, bone_info in animation.get("bones", {}).items():
+                    for channel, keyframes in bone_info.items():
+                        # A static value or Molang string is not keyframed
+                        if isinstance(keyframes, dict):
+                            channels[f"{identifier}/{bone}.{channel}"] = len(keyframes) / length
+
+            report[os.path.relpath(file_path, path).replace(os.sep, "/")] = {
+                "bytes": os.path.getsize(file_path),
+                "max_keyframes_per_second": max(channels.values(), default=0),
+                "channels": channels
+            }
+    return report
+
+
+def check_budget(functions: dict, animations: dict, budget: dict) -> list:
+    """Return a message for every budget the output exceeds."""
+    errors = []
+    if "commands_per_tick" in budget and functions["commands_per_tick"] > budget["commands_per_tick"]:
+        errors.append(f"{functions['commands_per_tick']} commands per tick, budget {budget['commands_per_tick']}")
+    if "selectors_per_tick" in budget and functions["selectors_per_tick"] > budget["selectors_per_tick"]:
+        errors.append(f"{functions['selectors_per_tick']} selectors per tick, budget {budget['selectors_per_tick']}")
+    if "function_bytes" in budget:
+        for name, info in functions["files"].items():
+            if info["bytes"] > budget["function_bytes"]:
+                errors.append(f"{name}.mcfunction is {info['bytes']} bytes, budget {budget['function_bytes']}")
+    if "keyframes_per_second" in budget:
+        for name, info in animations.items():
+            if info["max_keyframes_per_second"] > budget["keyframes_per_second"]:
+                errors.append(f"{name} has {info['max_keyframes_per_second']:.1f} keyframes per second, "
+                              f"budget {budget['keyframes_per_second']}")
+    return errors
+
+
+settings = json.loads(sys.argv[1]) if len(sys.argv) > 1 else {}
+
+functions = FunctionCostAnalyzer(exclusive=settings.get("exclusive", [])).report()
+animations = animation_report()
+
+for name, info in functions["tick"].items():
+    print(f"[INFO] {name}: {info['commands_per_tick']} commands, {info['selectors_per_tick']} selectors per tick "
+          f"per player at most")
+    for score, score_info in info.get("scores", {}).items():
+        print(f"[INFO]   with {score}: {score_info['commands_per_tick']} commands, "
+              f"{score_info['selectors_per_tick']} selectors")
+largest = sorted(functions["files"].items(), key=lambda x: x[1]["bytes"], reverse=True)[:5]
+for name, info in largest:
+    print(f"[INFO] {name}.mcfunction: {info['commands']} commands, {info['selectors']} selectors, "
+          f"{info['bytes']} bytes")
+for name, info in animations.items():
+    print(f"[INFO] {name}: {info['max_keyframes_per_second']:.1f} keyframes per second per bone at most")
+
+if "report" in settings:
+    with open(settings["report"], "w") as f:
+        json.dump({"functions": functions, "animations": animations}, f, indent=4)
+
+errors = check_budget(functions, animations, settings.get("budget", {}))
+for error in errors:
+    print(f"[ERROR] Over budget: {error}")
+if errors:
+    sys.exit(1)
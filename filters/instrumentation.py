@@ -0,0 +1,106 @@
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Per-stage timing and memory records for the filters. Settings read from the filter settings:
+#   "trace_memory": true       - record the peak traced Python allocation of every stage (slower)
+#   "profile": "mcmv.prof"     - run the filter under cProfile and dump the pstats to that file
+#   "stats": "mcmv.stats.json" - also write the summary to that file
+# The summary is always printed as a single "[STATS] {...}" line at the end of the run. Every record has the growth
+# of the process' peak RSS during its stage, rss_growth_kb; the peak of the whole run is max_rss_kb of the summary.
+
+
+def max_rss_kb() -> int:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return usage // 1024 if sys.platform == "darwin" else usage
+
+
+class StageRecorder:
+    def __init__(self, filter_name: str, settings: dict = None):
+        settings = settings or {}
+        self.filter_name = filter_name
+        self.trace_memory = bool(settings.get("trace_memory", False))
+        self.profile_path = settings.get("profile")
+        self.stats_path = settings.get("stats")
+
+        self.records = []
+        self._profiler = None
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile_path:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    @contextmanager
+    def stage(self, name: str, song: str = None, file: str = None):
+        """Record a stage. The yielded dict takes "frames" and "bytes" from the caller."""
+        record = {"stage": name, "song": song, "file": file, "frames": 0, "bytes": 0}
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        start_rss = max_rss_kb()
+        try:
+            yield record
+        finally:
+            record["wall_seconds"] = time.perf_counter() - start_wall
+            record["cpu_seconds"] = time.process_time() - start_cpu
+            # The peak only goes up, a stage that stays below an earlier peak grows it by 0
+            record["rss_growth_kb"] = max_rss_kb() - start_rss
+            if self.trace_memory:
+                record["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+            self.records.append(record)
+
+    @staticmethod
+    def path_size(path: str) -> int:
+        """Return the size of a file, or of every file below a directory."""
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(root, x)) for root, _, files in os.walk(path) for x in files)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def totals(self, key: str) -> dict:
+        """Return wall time, CPU time, frames and bytes summed per value of key ("stage", "song" or "file")."""
+        totals = {}
+        for record in self.records:
+            if record[key] is None:
+                continue
+            total = totals.setdefault(record[key], {"wall_seconds": 0.0, "cpu_seconds": 0.0, "frames": 0, "bytes": 0})
+            for field in total:
+                total[field] += record[field]
+        return totals
+
+    def summary(self) -> dict:
+        return {
+            "filter": self.filter_name,
+            "wall_seconds": time.perf_counter() - self._start_wall,
+            "cpu_seconds": time.process_time() - self._start_cpu,
+            "max_rss_kb": max_rss_kb(),
+            "stages": self.totals("stage"),
+            "songs": self.totals("song"),
+            "records": self.records
+        }
+
+    def finish(self) -> dict:
+        """Stop profiling, print the summary and write it and the profile when the settings ask for them."""
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_path)
+            print(f"[INFO] Wrote profile to {self.profile_path}")
+        if self.trace_memory:
+            tracemalloc.stop()
+
+        summary = self.summary()
+        print("[STATS] " + json.dumps(summary))
+        if self.stats_path:
+            with open(self.stats_path, "w") as f:
+                json.dump(summary, f, indent=4)
+        return summary
@@ -112,6 +112,22 @@ class ArmatureAnimation:
         return len(self.frames)
 
 
+class PoseTrack:
+    """Contains the retargeted local transformation of every Minecraft bone for a whole animation, stored per bone."""
+    positions: dict[str, list[tuple[float, float, float]]]
+    rotations: dict[str, list[tuple[float, float, float, float]]]
+    fps: int
+
+    def __init__(self, fps: Union[float, int]):
+        self.positions = {}
+        self.rotations = {}
+        self.fps = fps
+        self.frame_count = 0
+
+    def __len__(self):
+        return self.frame_count
+
+
 class DisplayVoxel:
     """Contains information regarding the visible part of the bone"""
     def __init__(self, offset: Vector3 = None, size: Vector3 = None, item: str = None):
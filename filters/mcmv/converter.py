@@ -1,5 +1,6 @@
 from mcmv.armature_formatter import ArmatureFormatter
-from mcmv.armature_objects import ArmatureModel, MinecraftModel, ArmatureFrame, Bone, PositionalBone
+from mcmv.armature_objects import ArmatureModel, MinecraftModel, ArmatureFrame, ArmatureAnimation, Bone, PositionalBone, \
+    VisibleBone, PoseTrack
 from mcmv.math_objects import Vector3, Quaternion, Euler
 
 
@@ -54,6 +55,96 @@ class RotationFixer:
         return rotation
 
 
+class RetargetPlan:
+    """The retargeting of a Minecraft model onto an armature, resolved once for a pair of models.
+
+    Joint names, rest rotations and output transforms of every bone are looked up when the plan is compiled,
+    so retargeting a frame only composes quaternions. The result is the same as set_minecraft_transformation().
+
+    output_transforms: {bone name: {"position_scale": float or [x, y, z], "position_offset": [x, y, z]}}, applied
+    to the local position of a positional bone, in model units, before it is exported. A negative scale flips an
+    axis.
+    """
+
+    def __init__(self, minecraft_model: MinecraftModel, model: ArmatureModel, translation: dict[str, str] = None,
+                 output_transforms: dict[str, dict] = None):
+        translation = translation or {}
+        output_transforms = output_transforms or {}
+
+        def lookup(key: str) -> str:
+            return translation.get(key, key)
+
+        # (parent rotation joint, rest rotation, position joint, [children]) of every bone with children, parents
+        # before children. A child is (name, rotation joint, rest rotation, position joint, scale, offset), with
+        # position joint None for bones with an animated rotation instead.
+        self.bones = []
+        self.positions = []
+        self.rotations = []
+
+        def compile_bone(bone: Bone):
+            joint = model.joints.get(lookup(bone.name))
+            parent_joint = joint.parent.name if joint is not None and joint.parent is not None else None
+            rest = Quaternion().between_vectors(bone.size, joint.initial_offset) if joint is not None else None
+            position_joint = lookup(bone.name) if joint is not None else None
+
+            children = []
+            for child_name, child in bone.children.items():
+                child_joint = model.joints[lookup(child_name)]
+                child_rest = Quaternion().between_vectors(child.size, child_joint.initial_offset)
+                transform = output_transforms.get(child_name, {})
+                scale = transform.get("position_scale", 1.0)
+                scale = tuple(scale) if isinstance(scale, (list, tuple)) else (scale, scale, scale)
+                offset = tuple(transform.get("position_offset", (0.0, 0.0, 0.0)))
+
+                if isinstance(child, PositionalBone):
+                    self.positions.append(child_name)
+                    children.append((child_name, child_joint.parent.name, child_rest, lookup(child_name),
+                                     scale, offset))
+                elif isinstance(child, VisibleBone):
+                    self.rotations.append(child_name)
+                    children.append((child_name, child_joint.parent.name, child_rest, None, None, None))
+
+            self.bones.append((parent_joint, rest, position_joint, children))
+            for child in bone.children.values():
+                compile_bone(child)
+
+        compile_bone(minecraft_model.root)
+
+    def get_pose_track(self, model: ArmatureModel, animation: ArmatureAnimation) -> PoseTrack:
+        """Retarget every frame of the animation and return the local pose of each bone as per-bone arrays."""
+        track = PoseTrack(animation.fps)
+        for name in self.positions:
+            track.positions[name] = []
+        for name in self.rotations:
+            track.rotations[name] = []
+        positions = track.positions
+        rotations = track.rotations
+        identity = Quaternion()
+        origin = Vector3()
+
+        for frame in animation.frames:
+            ArmatureFormatter.set_frame(model, frame)
+            global_transformation = ArmatureFormatter.get_model_global(model)
+
+            for parent_joint, rest, position_joint, children in self.bones:
+                parent_global_rotation = global_transformation[parent_joint][1] if parent_joint else identity
+                parent_real_rotation = rest.parented(parent_global_rotation) if rest else parent_global_rotation
+                parent_inverse = parent_real_rotation.conjugate()
+                parent_position = global_transformation[position_joint][0] if position_joint else origin
+
+                for name, rotation_joint, child_rest, child_position_joint, scale, offset in children:
+                    if child_position_joint is not None:
+                        x, y, z = (global_transformation[child_position_joint][0] - parent_position).to_tuple()
+                        positions[name].append((x * scale[0] + offset[0], y * scale[1] + offset[1],
+                                                z * scale[2] + offset[2]))
+                    else:
+                        child_real_rotation = child_rest.parented(global_transformation[rotation_joint][1])
+                        rotations[name].append(child_real_rotation.parented(parent_inverse).to_tuple())
+
+        track.frame_count = len(animation.frames)
+        return track
+
+
 class Converter:
 
     @staticmethod
@@ -109,6 +200,13 @@ class Converter:
 
         dfs(minecraft_model.root)
 
+    @staticmethod
+    def get_pose_track(minecraft_model: MinecraftModel, model: ArmatureModel, animation: ArmatureAnimation,
+                       translation: dict[str, str], output_transforms: dict[str, dict] = None) -> PoseTrack:
+        """Retarget every frame of the animation and return the local pose of each bone as per-bone arrays.
+        See RetargetPlan for output_transforms."""
+        return RetargetPlan(minecraft_model, model, translation, output_transforms).get_pose_track(model, animation)
+
     @staticmethod
     def get_global_minecraft(minecraft_model: MinecraftModel) -> dict[str, tuple[Vector3, Quaternion]]:
         global_transformation = {
@@ -5,7 +5,8 @@ from typing import Optional
 
 from mcmv import utility
 from mcmv.armature_formatter import MinecraftModelFormatter
-from mcmv.armature_objects import ArmatureModel, MinecraftModel, DisplayVoxel, ArmatureAnimation, VisibleBone, PositionalBone
+from mcmv.armature_objects import ArmatureModel, MinecraftModel, DisplayVoxel, ArmatureAnimation, VisibleBone, PositionalBone, \
+    PoseTrack
 from mcmv.converter import Converter, RotationFixer
 from mcmv.math_objects import Vector3, Euler, Quaternion
 
@@ -122,10 +123,62 @@ class BedrockGeoFileFormatter:
         return self._json_info
 
 
+class BedrockAnimStreamWriter:
+    """Incrementally writes a .animation.json file, one bone channel at a time.
+
+    With indent=None the output is byte-identical to json.dumps() of the complete animation.
+    """
+
+    def __init__(self, file, format_version: str, identifier: str, animation_length: float, indent: Optional[int] = None):
+        self._file = file
+        self._indent = indent
+        self._bone_count = 0
+
+        header = json.dumps({
+            "format_version": format_version,
+            "animations": {
+                identifier: {
+                    "animation_length": animation_length,
+                    "bones": {}
+                }
+            }
+        }, ensure_ascii=False, indent=indent)
+
+        # Split the document right inside the empty "bones" object.
+        split = header.rindex('{}') + 1
+        self._file.write(header[:split])
+        self._footer = header[split:]
+
+    def write_bone(self, bone_name: str, bone_info: dict) -> None:
+        """Write the channels of a single bone."""
+        if self._indent is None:
+            separator = ', ' if self._bone_count else ''
+            value = json.dumps(bone_info, ensure_ascii=False)
+        else:
+            # bones live 4 levels deep: root > animations > identifier > bones
+            padding = '\n' + ' ' * (self._indent * 4)
+            separator = (',' if self._bone_count else '') + padding
+            value = json.dumps(bone_info, ensure_ascii=False, indent=self._indent).replace('\n', padding)
+
+        self._file.write(separator + json.dumps(bone_name, ensure_ascii=False) + ': ' + value)
+        self._bone_count += 1
+
+    def close(self) -> None:
+        """Write the end of the document. Does not close the underlying file."""
+        if self._indent is not None and self._bone_count:
+            self._file.write('\n' + ' ' * (self._indent * 3))
+        self._file.write(self._footer)
+
+
 class BedrockAnimFileFormatter:
-    def __init__(self, format_version: str, identifier: str):
+    def __init__(self, format_version: str, identifier: str, precision: Optional[int] = None, sparse: bool = False):
+        """With precision, time keys are rounded to 4 decimals and values to that many decimals.
+        With sparse, held keyframes are dropped, constant channels become a single static value and empty
+        channels are left out when a bone is written. The defaults keep every keyframe as computed."""
         self.format_version = format_version
         self.identifier = identifier
+        self.precision = precision
+        self.sparse = sparse
 
         self._bone_dict = {}
         self.model_no = ''
@@ -153,19 +206,81 @@ class BedrockAnimFileFormatter:
         if position is not None:
             bedrock_position = BedrockUtility.get_animation_position(position)
 
-            bone_info['position'][str(time)] = list(
+            bone_info['position'][self._time_key(time)] = self._values(
                 bedrock_position.to_tuple())
 
         if rotation is not None:
             bedrock_rotation = BedrockUtility.get_rotation(rotation)
             bedrock_rotation = self.r.fix_rotation(bone_name, bedrock_rotation)
 
-            bone_info['rotation'][str(time)] = list(
+            bone_info['rotation'][self._time_key(time)] = self._values(
                 bedrock_rotation.to_tuple())
 
+    def _time_key(self, time: float) -> str:
+        if self.precision is None:
+            return str(time)
+        # 4 decimals drop float noise like 0.15000000000000002, keys stay on the frame times of the track
+        # (0.0333, 0.0667, ... at 30 fps), they are not moved to ticks
+        return str(round(time, 4))
+
+    def _values(self, values: tuple) -> list:
+        if self.precision is None:
+            return list(values)
+        # `or 0.0` turns -0.0 into 0.0
+        return [round(x, self.precision) or 0.0 for x in values]
+
+    @staticmethod
+    def _compact_channel(keyframes: dict):
+        """Return the channel without held keyframes, as a single value if it never changes."""
+        times = list(keyframes)
+        values = list(keyframes.values())
+        if all(x == values[0] for x in values):
+            return values[0]
+
+        # A key between two equal keys is already given by linear interpolation
+        compact = {}
+        for i, time in enumerate(times):
+            if 0 < i < len(times) - 1 and values[i - 1] == values[i] == values[i + 1]:
+                continue
+            compact[time] = values[i]
+        return compact
+
+    def _pop_bone(self, bone_name: str) -> dict:
+        bone_info = self._bone_dict.pop(bone_name)
+        if not self.sparse:
+            return bone_info
+        return {channel: self._compact_channel(keyframes) for channel, keyframes in bone_info.items() if keyframes}
+
     def get_json_info(self):
         return self._json_info
 
+    def segment(self, index: int) -> 'BedrockAnimFileFormatter':
+        """Return a formatter for segment index of this animation, identified as {identifier}.{index}.
+        Segments share the rotation fixer, so rotations stay continuous from one segment to the next."""
+        formatter = BedrockAnimFileFormatter(self.format_version, f"{self.identifier}.{index}", self.precision,
+                                             self.sparse)
+        formatter.model_no = self.model_no
+        formatter.r = self.r
+        return formatter
+
+    def open_stream(self, file, indent: Optional[int] = None) -> BedrockAnimStreamWriter:
+        """Return a writer that streams this animation to file. Call flush_bone() for each bone, then close()."""
+        animation_info = self._json_info['animations'][self.identifier]
+        return BedrockAnimStreamWriter(file, self.format_version, self.identifier,
+                                       animation_info['animation_length'], indent)
+
+    def flush_bone(self, bone_name: str, writer: BedrockAnimStreamWriter) -> None:
+        """Write the keyframes collected for bone_name and release them."""
+        bone_name = utility.compatible_bone_name(bone_name + self.model_no)
+        writer.write_bone(bone_name, self._pop_bone(bone_name))
+
+    def stream_to(self, file, indent: Optional[int] = None) -> None:
+        """Write the animation to file one bone at a time, releasing each bone once it is written."""
+        writer = self.open_stream(file, indent)
+        for bone_name in list(self._bone_dict):
+            writer.write_bone(bone_name, self._pop_bone(bone_name))
+        writer.close()
+
 
 class BedrockModelExporter:
     translation: Optional[dict[str, str]]
@@ -223,10 +338,19 @@ class BedrockModelExporter:
 
         g.write(json.dumps(model_header.get_json_info(), ensure_ascii=False))
 
-    def write_animation(self, path: str, file_name: str, model_header: BedrockAnimFileFormatter, animation: ArmatureAnimation):
+    def write_animation(self, path: str, file_name: str, model_header: BedrockAnimFileFormatter, animation: ArmatureAnimation,
+                        indent: Optional[int] = None, bone_major: bool = False):
+        """Write the animation to a .animation.json file. Bones are streamed to the file one at a time.
+
+        With bone_major, the whole pose track is retargeted first and every bone is then converted and written
+        on its own, so only one bone's keyframes are held at a time. The output is identical in both modes.
+        """
+        if bone_major:
+            track = Converter.get_pose_track(self.minecraft_model, self.original_model, animation, self.translation)
+            self.write_pose_track(path, file_name, model_header, track, indent)
+            return
+
         complete_path = os.path.join(path, file_name + ".animation.json")
-        open(complete_path, 'w').close()
-        g = open(complete_path, "a", encoding="utf-8")
         model_header.set_animation_length(
             math.ceil(len(animation.frames) / animation.fps))
         model_header.model_no = self.model_no
@@ -250,4 +374,67 @@ class BedrockModelExporter:
                     model_header.add_keyframe(
                         bone_name, frame_time, None, bone.local_animation_rotation)
 
-        g.write(json.dumps(model_header.get_json_info(), ensure_ascii=False))
+        with open(complete_path, "w", encoding="utf-8") as g:
+            model_header.stream_to(g, indent)
+
+    def write_pose_track(self, path: str, file_name: str, model_header: BedrockAnimFileFormatter, track: PoseTrack,
+                         indent: Optional[int] = None, animation_length: Optional[float] = None,
+                         segment_seconds: Optional[float] = None) -> list[str]:
+        """Write a pose track from Converter.get_pose_track() to a .animation.json file, bone by bone, and return
+        the paths written. animation_length defaults to the track length rounded up to whole seconds.
+
+        With segment_seconds, the track is split into {file_name}.{k}.animation.json files of that length,
+        identified as {identifier}.{k}, with their times starting at 0. The frame at a boundary ends one segment
+        and starts the next, and the last segment lasts until animation_length.
+        """
+        if animation_length is None:
+            animation_length = math.ceil(len(track) / track.fps)
+        model_header.model_no = self.model_no
+
+        if segment_seconds is None:
+            complete_path = os.path.join(path, file_name + ".animation.json")
+            model_header.set_animation_length(animation_length)
+            self._write_track_frames(complete_path, model_header, track, range(len(track)), indent)
+            return [complete_path]
+
+        segment_frames = max(round(segment_seconds * track.fps), 1)
+        segment_count = max(math.ceil((len(track) - 1) / segment_frames), 1)
+        paths = []
+        for k in range(segment_count):
+            first = k * segment_frames
+            last = min(first + segment_frames, len(track) - 1)
+            segment_header = model_header.segment(k)
+            if k < segment_count - 1:
+                segment_header.set_animation_length(segment_seconds)
+            else:
+                segment_header.set_animation_length(
+                    round(max(animation_length - first / track.fps, (last - first) / track.fps), 4))
+
+            complete_path = os.path.join(path, f"{file_name}.{k}.animation.json")
+            self._write_track_frames(complete_path, segment_header, track, range(first, last + 1), indent)
+            paths.append(complete_path)
+        return paths
+
+    def _write_track_frames(self, complete_path: str, model_header: BedrockAnimFileFormatter, track: PoseTrack,
+                            frames: range, indent: Optional[int] = None):
+        """Stream the frames of the track to complete_path, with times counted from the first frame."""
+        frame_times = [(i - frames.start) / track.fps for i in frames]
+
+        with open(complete_path, "w", encoding="utf-8") as g:
+            writer = model_header.open_stream(g, indent)
+
+            for bone_name in self.minecraft_model.bones:
+                if bone_name in track.positions:
+                    positions = track.positions[bone_name][frames.start:frames.stop]
+                    for frame_time, position in zip(frame_times, positions):
+                        model_header.add_keyframe(bone_name, frame_time, Vector3(*position), None)
+                elif bone_name in track.rotations:
+                    rotations = track.rotations[bone_name][frames.start:frames.stop]
+                    for frame_time, rotation in zip(frame_times, rotations):
+                        model_header.add_keyframe(bone_name, frame_time, None, Quaternion(*rotation))
+                else:
+                    continue
+
+                model_header.flush_bone(bone_name, writer)
+
+            writer.close()
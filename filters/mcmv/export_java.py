@@ -24,15 +24,29 @@ class JavaUtility:
 
     @staticmethod
     def get_rotation(quaternion: Quaternion, rotate: Quaternion) -> Euler:
-        rotation = Euler('zyx').set_from_quaternion(quaternion.parented(rotate).parented(Quaternion(0.0, 1.0, 0.0, 0.0)))
-        rotation.x *= -1
-        rotation.y *= -1
-        quaternion = Quaternion().set_from_euler(rotation)
+        """Return the armor stand head pose for a bone rotation."""
+        return JavaUtility._get_head_pose(quaternion, JavaUtility._get_pose_frame(rotate))
 
+    @staticmethod
+    def get_rotations(quaternions: list[Quaternion], rotate: Quaternion) -> list[Euler]:
+        """Return the armor stand head poses for a list of bone rotations sharing the same rotate."""
+        pose_frame = JavaUtility._get_pose_frame(rotate)
+        return [JavaUtility._get_head_pose(quaternion, pose_frame) for quaternion in quaternions]
+
+    @staticmethod
+    def _get_pose_frame(rotate: Quaternion) -> Quaternion:
         # account for the fact that y angle 0 is south
-        rotation = Euler('zyx').set_from_quaternion(quaternion)
+        return rotate.parented(Quaternion(0.0, 1.0, 0.0, 0.0))
+
+    @staticmethod
+    def _get_head_pose(quaternion: Quaternion, pose_frame: Quaternion) -> Euler:
+        # Negating the x and y Euler angles is the same as rotating half a turn around z on both sides, which
+        # negates the x and y components of the quaternion. This saves two Euler conversions.
+        rotation = quaternion.parented(pose_frame)
+        rotation.x = -rotation.x
+        rotation.y = -rotation.y
 
-        return rotation
+        return Euler('zyx').set_from_quaternion(rotation)
 
 
 class AecStandPair:
@@ -61,16 +75,61 @@ class AecStandPair:
         tag = self._seed_prefix.split('/')
         self.common_tags = {'armature_stands', 'path_' + tag[0].replace(':', '_')}
 
+        self.tags = self.common_tags.copy()
+        self.tags.add('bn_' + self.name.replace(' ', '_'))
+
         self._update = False
 
         self.show_names = False
         self.allow_rotation = allow_rotation
 
+        # Transformations within these thresholds of the last emitted ones are skipped. None disables skipping.
+        self.position_threshold = None
+        self.rotation_threshold = None
+        self.skipped_commands = 0
+        self._last_position = None
+        self._last_rotation = None
+
+        self.compile_template()
+
+    def compile_template(self) -> None:
+        """Precompute the parts of the transformation commands that stay the same every tick.
+
+        Call this again after changing root or allow_rotation.
+        """
+        if self._end_rod_fix is not None:
+            end_rod_angle = Vector3(0.0, math.sin(math.radians(30)), -math.cos(math.radians(30)))
+            if self._end_rod_fix[1] == 'x':
+                final_angle = Vector3(1.0, 0.0, 0.0)
+            elif self._end_rod_fix[1] == 'y':
+                final_angle = Vector3(0.0, 1.0, 0.0)
+            else:
+                final_angle = Vector3(0.0, 0.0, 1.0)
+            if self._end_rod_fix[0] == '-':
+                final_angle *= -1
+
+            self._end_rod_rotation = Quaternion().between_vectors(end_rod_angle, final_angle)
+        else:
+            self._end_rod_rotation = None
+
+        if type(self.root) is Vector3:
+            self._teleport_template = 'tp ' + self.aec_uuid + ' {:f} {:f} {:f}'
+            self._stand_rotation_command = None
+        else:
+            self._teleport_template = 'execute at ' + self.root + ' run tp ' + self.aec_uuid + ' ^{:f} ^{:f} ^{:f} ~ ~'
+            if self.allow_rotation:
+                self._stand_rotation_command = 'execute at ' + self.stand_uuid + ' rotated as ' + self.root + \
+                    ' run tp ' + self.stand_uuid + ' ~ ~ ~ ~ ~'
+            else:
+                self._stand_rotation_command = None
+
+        self._air_commands = tuple('data merge entity ' + self.aec_uuid + ' {Air: ' + str(i) + '}' for i in (0, 1))
+        self._pose_template = 'data merge entity ' + self.stand_uuid + ' {{Pose:{{Head:[{:f}f, {:f}f, {:f}f]}}}}'
+
     def return_reset_commands(self) -> list[str]:
         """Return a list of commands to reset the AEC-Stand pair."""
 
-        tags = self.common_tags.copy()
-        tags.add('bn_' + self.name.replace(' ', '_'))
+        tags = self.tags
 
         commands = [
             'kill ' + self.aec_uuid,
@@ -95,59 +154,56 @@ class AecStandPair:
     def return_remove_commands(self) -> list[str]:
         """Return a list of commands to remove the AEC-Stand pair."""
 
-        tags = self.common_tags.copy()
-        tags.add('bn_' + self.name.replace(' ', '_'))
-
         commands = ['kill ' + self.aec_uuid,
                     'kill ' + self.stand_uuid]
         return commands
 
     def return_transformation_command(self, position: Vector3 = Vector3(), rotation: Quaternion = Quaternion(), offset: Vector3 = Vector3(), rotate: Quaternion = Quaternion()) -> str:
+        """Return the commands moving the pair to the given pose, separated by new lines.
+
+        Parts of the pose that are within the thresholds of the last emitted pose are left out, so the result may be
+        empty. Positions relative to a root entity are always emitted since the root itself may have moved.
+        """
 
         if type(self.root) is Vector3:
             position = JavaUtility.get_animation_position(position, offset, rotate)
-            commands = [
-                'tp ' + self.aec_uuid + ' {} {} {}'.format(
-                    *('{:f}'.format(i) for i in (position + self.root).to_tuple()))
-            ]
+            final_position = (position + self.root).to_tuple()
+            if self._within_threshold(self._last_position, final_position, self.position_threshold):
+                commands = []
+                self.skipped_commands += 2
+            else:
+                self._last_position = final_position
+                commands = [self._teleport_template.format(*final_position)]
         else:
             position = JavaUtility.get_relative_animation_position(position, offset, rotate)
-            commands = [
-                'execute at ' + self.root + ' run tp ' + self.aec_uuid + ' ^{} ^{} ^{}'.format(
-                    *('{:f}'.format(i) for i in position.to_tuple())) + ' ~ ~'
-            ]
-            if self.allow_rotation:
-                commands.append(
-                    'execute at ' + self.stand_uuid + ' rotated as ' + self.
-                    root + ' run tp ' + self.stand_uuid + ' ~ ~ ~ ~ ~'
-                )
-
-        commands.append('data merge entity ' + self.aec_uuid + ' {Air: ' + str(int(self._update)) + '}')
-        self._update = not self._update
-
-        if self._end_rod_fix is not None:
-            end_rod_angle = Vector3(0.0, math.sin(math.radians(30)), -math.cos(math.radians(30)))
-            if self._end_rod_fix[1] == 'x':
-                final_angle = Vector3(1.0, 0.0, 0.0)
-            elif self._end_rod_fix[1] == 'y':
-                final_angle = Vector3(0.0, 1.0, 0.0)
-            else:
-                final_angle = Vector3(0.0, 0.0, 1.0)
-            if self._end_rod_fix[0] == '-':
-                final_angle *= -1
+            commands = [self._teleport_template.format(*position.to_tuple())]
+            if self._stand_rotation_command is not None:
+                commands.append(self._stand_rotation_command)
 
-            rotation = Quaternion().between_vectors(end_rod_angle, final_angle).parented(rotation)
+        if commands:
+            commands.append(self._air_commands[self._update])
+            self._update = not self._update
 
-            # rotation = rotation.parented(Quaternion().between_vectors(end_rod_angle, final_angle))
+        if self._end_rod_rotation is not None:
+            rotation = self._end_rod_rotation.parented(rotation)
 
-        final_rotation = JavaUtility.get_rotation(rotation, rotate)
+        final_rotation = JavaUtility.get_rotation(rotation, rotate).to_tuple()
 
-
-        commands.append(
-            'data merge entity ' + self.stand_uuid + ' {Pose:{Head:' + utility.tuple_to_m_list(final_rotation.to_tuple(), 'f') + '}}')
+        if self._within_threshold(self._last_rotation, final_rotation, self.rotation_threshold):
+            self.skipped_commands += 1
+        else:
+            self._last_rotation = final_rotation
+            commands.append(self._pose_template.format(*final_rotation))
 
         return '\n'.join(commands)
 
+    @staticmethod
+    def _within_threshold(last: Optional[tuple], current: tuple, threshold: Optional[float]) -> bool:
+        """Return whether every component of current is within threshold of last."""
+        if threshold is None or last is None:
+            return False
+        return all(abs(a - b) <= threshold for a, b in zip(last, current))
+
 
 class JavaModelExporter:
     translation: Optional[dict[str, str]]
@@ -160,13 +216,35 @@ class JavaModelExporter:
 
     aec_stand_pairs: dict[str, dict[str, AecStandPair]]
 
-    def __init__(self, function_directory: str):
+    def __init__(self, function_directory: str, ticks_per_file: int = 1, selector_objective: str = 'global animation_time',
+                 buffered_files: int = 256, position_threshold: float = None, rotation_threshold: float = None):
+        """Create a new exporter writing into function_directory.
+
+            ticks_per_file: Number of consecutive ticks packed into one function file. Every line of a packed file
+                is guarded by the tick it belongs to, so this trades function files for commands run per tick.
+            selector_objective: The selector and objective pair holding the current tick, used by packed files and
+                the search function.
+            buffered_files: Number of function files kept in memory before they are written out.
+            position_threshold: Skip teleports that move a pair by at most this many blocks along every axis since
+                its last teleport. None emits every teleport.
+            rotation_threshold: Skip head poses that differ by at most this many degrees along every axis from the
+                last emitted pose. None emits every pose.
+        """
         self.max_ticks = 0
         self.translation = None
         self.fps = 20
         self.function_directory = ''
         self.aec_stand_pairs = {}
 
+        self.ticks_per_file = ticks_per_file
+        self.selector_objective = selector_objective
+        self.buffered_files = buffered_files
+        self.position_threshold = position_threshold
+        self.rotation_threshold = rotation_threshold
+
+        self.command_count = 0
+        self.skipped_command_count = 0
+
         # Ensure that the directory points into a Minecraft datapack folder.
         if 'functions' in function_directory and 'datapacks' in function_directory \
                 and 'functions' not in function_directory[-10:len(function_directory)]:
@@ -204,26 +282,60 @@ class JavaModelExporter:
         for bone_name in self.minecraft_model.bones:
             bone = self.minecraft_model.bones[bone_name]
             if isinstance(bone, VisibleBone):
-                self.aec_stand_pairs[function_name][bone_name] = AecStandPair(bone.name, (self.function_directory, function_name), root, bone.display.item, allow_rotation, minecraft_model_no)
+                aec_stand = AecStandPair(bone.name, (self.function_directory, function_name), root, bone.display.item, allow_rotation, minecraft_model_no)
+                aec_stand.position_threshold = self.position_threshold
+                aec_stand.rotation_threshold = self.rotation_threshold
+                self.aec_stand_pairs[function_name][bone_name] = aec_stand
 
-        for tick, frame in enumerate(animation.frames):
-            complete_path = os.path.join(self.function_directory, function_name, str(tick) + ".mcfunction")
-            open(complete_path, 'w').close()
-            g = open(complete_path, "a")
+        # file index -> lines, written out in bulk once enough files are complete
+        pending_files = {}
+        emitted = 0
 
+        for tick, frame in enumerate(animation.frames):
             Converter.set_animation_frame(self.original_model, frame)
             Converter.set_minecraft_transformation(self.minecraft_model, self.original_model, self.translation)
             global_transformation = Converter.get_global_minecraft(self.minecraft_model)
 
+            file_index = tick // self.ticks_per_file
+            lines = pending_files.setdefault(file_index, [])
+            if self.ticks_per_file > 1:
+                guard = 'execute if score ' + self.selector_objective + ' matches ' + str(tick) + ' run '
+            else:
+                guard = ''
+
             for bone_name in self.aec_stand_pairs[function_name]:
                 aec_stand = self.aec_stand_pairs[function_name][bone_name]
                 position, rotation = global_transformation[bone_name]
 
                 commands = aec_stand.return_transformation_command(position, rotation, offset, rotate)
+                if not commands:
+                    continue
+
+                commands = commands.split('\n')
+                emitted += len(commands)
+                lines.extend(guard + command for command in commands)
 
-                g.write(commands + '\n')
+            if (tick + 1) % self.ticks_per_file == 0 and len(pending_files) >= self.buffered_files:
+                self._write_function_files(function_name, pending_files)
+                pending_files = {}
+
+        self._write_function_files(function_name, pending_files)
         self.max_ticks = max(self.max_ticks, len(animation))
 
+        skipped = sum(aec_stand.skipped_commands for aec_stand in self.aec_stand_pairs[function_name].values())
+        self.command_count += emitted
+        self.skipped_command_count += skipped
+        if skipped:
+            print('[INFO] {}: skipped {} of {} transformation commands ({:.1f}% fewer)'.format(
+                function_name, skipped, skipped + emitted, 100 * skipped / (skipped + emitted)))
+
+    def _write_function_files(self, function_name: str, files: dict[int, list[str]]) -> None:
+        """Write complete function files, opening a single handle at a time."""
+        for file_index in files:
+            complete_path = os.path.join(self.function_directory, function_name, str(file_index) + ".mcfunction")
+            with open(complete_path, "w") as g:
+                g.write('\n'.join(files[file_index]) + '\n')
+
     def write_reset_function(self):
         """Write commands to remove and summon necessary AEC-Stand pairs.
         """
@@ -266,18 +378,32 @@ class JavaModelExporter:
                     'this Armature!","color":"white"}]')
         f.close()
 
-    def write_search_function(self, selector_objective: str = 'global animation_time', auto: bool = True, loop: bool = True) -> None:
+    def write_search_function(self, selector_objective: str = None, auto: bool = True, loop: bool = True,
+                              divisions: Union[int, mc_search_function.SearchCostModel] = 8,
+                              segment_ticks: Optional[int] = None) -> None:
+        """Write the search function over the animation files and call it from main.
+
+        With segment_ticks, the root of the search function picks a subtree per segment_ticks ticks, so no single
+        function file of the tree grows with the length of the animation.
+        """
+        if selector_objective is None:
+            selector_objective = self.selector_objective
 
-        def commands(tick):
+        def commands(file_index):
             command_list = []
 
             for function_name in self.aec_stand_pairs:
-                command_list.append('function ' + utility.get_function_directory(self.function_directory, function_name) + '/' + str(tick))
+                command_list.append('function ' + utility.get_function_directory(self.function_directory, function_name) + '/' + str(file_index))
 
             return command_list
 
-        mc_search_function.create_search_function(os.path.join(self.function_directory, 'search'), utility.get_function_directory(self.function_directory, 'search'), selector_objective, commands,
-                                                  (0, self.max_ticks), (True, True), divisions=8)
+        stats = mc_search_function.create_search_function(os.path.join(self.function_directory, 'search'), utility.get_function_directory(self.function_directory, 'search'), selector_objective, commands,
+                                                          (0, self.max_ticks // self.ticks_per_file), (True, True),
+                                                          scale=self.ticks_per_file, divisions=divisions,
+                                                          segment_size=max(segment_ticks // self.ticks_per_file, 1)
+                                                          if segment_ticks else None)
+        print('[INFO] search function: {} files, {:.1f} commands per tick on average, {} at most'.format(
+            stats.files, stats.expected_commands, stats.max_commands))
 
         complete_path = os.path.join(self.function_directory, 'main' + ".mcfunction")
         f = open(complete_path, "a")
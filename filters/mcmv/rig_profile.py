@@ -0,0 +1,138 @@
+import copy
+import json
+import os
+
+from mcmv.armature_formatter import MinecraftModelCreator
+from mcmv.armature_objects import ArmatureModel, DisplayVoxel, MinecraftModel
+from mcmv.converter import RetargetPlan
+from mcmv.math_objects import Vector3
+
+# Rig profiles, data/rigs/{name}.json:
+# {
+#     "translation": {"hip": "Hip", ...},                Minecraft bone -> armature joint, defaults to the same name
+#     "bones": [
+#         {"parent": "body", "name": "head", "size": [0, 8, 0], "offset": [0, 0, 0],
+#          "display": {"offset": [-4, 0, -4], "size": [8, 8, 8], "item": "diamond_hoe{CustomModelData:100}"}},
+#         {"parent": "root", "name": "hip"}          a bone without size, offset and display only moves
+#     ],
+#     "output_transforms": {"hip": {"position_scale": 20}}   see RetargetPlan
+# }
+# Sizes and offsets are in pixels. The parent of exactly one bone is not a bone, it becomes the root.
+
+TRANSFORM_KEYS = {"position_scale", "position_offset"}
+
+
+def _is_vector(value) -> bool:
+    return isinstance(value, list) and len(value) == 3 and all(isinstance(x, (int, float)) for x in value)
+
+
+def validate_rig(data: dict, name: str = "rig") -> list[str]:
+    """Return a message for every problem of a rig profile, empty if it is valid."""
+    if not isinstance(data, dict):
+        return [f"{name} is not an object"]
+    errors = []
+    unknown = set(data) - {"translation", "bones", "output_transforms"}
+    if unknown:
+        errors.append(f"{name} has unknown keys {sorted(unknown)}")
+
+    bones = data.get("bones")
+    if not isinstance(bones, list) or not bones:
+        return errors + [f"{name} has no bones"]
+
+    names = set()
+    positional = set()
+    for i, bone in enumerate(bones):
+        if not isinstance(bone, dict) or not isinstance(bone.get("name"), str) or \
+                not isinstance(bone.get("parent"), str):
+            errors.append(f"{name} bone {i} needs a name and a parent")
+            continue
+        if bone["name"] in names:
+            errors.append(f"{name} bone {bone['name']} is defined twice")
+        names.add(bone["name"])
+
+        if set(bone) <= {"name", "parent"}:
+            positional.add(bone["name"])
+            continue
+        if not _is_vector(bone.get("size")) or not _is_vector(bone.get("offset")):
+            errors.append(f"{name} bone {bone['name']} needs a size and an offset of 3 numbers")
+        display = bone.get("display")
+        if not isinstance(display, dict) or not _is_vector(display.get("offset")) or \
+                not _is_vector(display.get("size")) or not isinstance(display.get("item"), str):
+            errors.append(f"{name} bone {bone['name']} needs a display with an offset, a size and an item")
+
+    roots = {bone["parent"] for bone in bones if isinstance(bone, dict) and bone.get("parent") not in names}
+    if len(roots) != 1:
+        errors.append(f"{name} needs exactly one root, found {sorted(str(x) for x in roots)}")
+
+    translation = data.get("translation", {})
+    if not isinstance(translation, dict) or not all(isinstance(x, str) for x in translation.values()):
+        errors.append(f"{name} translation must map bones to joint names")
+    else:
+        unknown = set(translation) - names - roots
+        if unknown:
+            errors.append(f"{name} translation has unknown bones {sorted(unknown)}")
+
+    transforms = data.get("output_transforms", {})
+    if not isinstance(transforms, dict):
+        errors.append(f"{name} output_transforms must be an object")
+        transforms = {}
+    for bone, transform in transforms.items():
+        if bone not in positional:
+            errors.append(f"{name} output transform of {bone}: only bones without a display move")
+            continue
+        if not isinstance(transform, dict) or set(transform) - TRANSFORM_KEYS:
+            errors.append(f"{name} output transform of {bone} takes {sorted(TRANSFORM_KEYS)}")
+            continue
+        scale = transform.get("position_scale", 1)
+        if not isinstance(scale, (int, float)) and not _is_vector(scale):
+            errors.append(f"{name} position_scale of {bone} must be a number or 3 numbers")
+        if not _is_vector(transform.get("position_offset", [0, 0, 0])):
+            errors.append(f"{name} position_offset of {bone} must be 3 numbers")
+    return errors
+
+
+class RigProfile:
+    """A validated rig profile. Every call of minecraft_model() builds a new model, so a track can not change
+    the model of another track."""
+
+    def __init__(self, name: str, data: dict):
+        errors = validate_rig(data, name)
+        if errors:
+            raise ValueError("Invalid rig profile: " + "; ".join(errors))
+
+        self.name = name
+        self.translation = dict(data.get("translation", {}))
+        self.output_transforms = dict(data.get("output_transforms", {}))
+        self.bones = copy.deepcopy(data["bones"])
+
+    def minecraft_model(self) -> MinecraftModel:
+        """Return a new Minecraft model of this rig."""
+        bone_list = []
+        for bone in self.bones:
+            if "display" not in bone:
+                bone_list.append((bone["parent"], bone["name"]))
+                continue
+            display = bone["display"]
+            bone_list.append((
+                bone["parent"],
+                bone["name"],
+                Vector3(*bone["size"]),
+                Vector3(*bone["offset"]),
+                DisplayVoxel(Vector3(*display["offset"]), Vector3(*display["size"]), display["item"])
+            ))
+
+        creator = MinecraftModelCreator()
+        creator.set_bones(bone_list)
+        return creator.minecraft_model
+
+    def retarget_plan(self, model: ArmatureModel, minecraft_model: MinecraftModel = None) -> RetargetPlan:
+        """Return the retarget plan of this rig onto an armature, for minecraft_model or a new model."""
+        return RetargetPlan(minecraft_model or self.minecraft_model(), model, self.translation,
+                            self.output_transforms)
+
+
+def load_rig(path: str) -> RigProfile:
+    """Load and validate the rig profile at path."""
+    with open(path, "r") as f:
+        data = json.load(f)
+    return RigProfile(os.path.splitext(os.path.basename(path))[0], data)
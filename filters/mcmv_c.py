@@ -1,145 +1,123 @@
-from mcmv.armature_formatter import MinecraftModelCreator
-from mcmv.armature_objects import DisplayVoxel
 from mcmv.export_bedrock import BedrockModelExporter, BedrockGeoFileFormatter, BedrockAnimFileFormatter
 from mcmv.export_java import JavaModelExporter
 from mcmv.import_file import BvhFileLoader
-from mcmv.math_objects import Vector3, Quaternion, Euler
+from mcmv.math_objects import Quaternion, Euler
+from mcmv.rig_profile import load_rig
 import sys
 import json
 import os
 
-import mcmv_scale
 import camera as cam
+from audio import sound_duration
+from instrumentation import StageRecorder
+from song_registry import SongRegistry
 
-translation = {
-    "root": "Body",
-    "hip": "Hip",
-    "body": "Chest",
-    "head": "Head",
-    "elbow_l": "Right_Elbow",
-    "wrist_l": "Right_ForeArmRoll",
-    "knee_l": "Right_Knee",
-    "ankle_l": "Right_Ankle",
-    "elbow_r": "Left_Elbow",
-    "wrist_r": "Left_ForeArmRoll",
-    "knee_r": "Left_Knee",
-    "ankle_r": "Left_Ankle",
-}
-bone_list = [
-    ('body',
-     'head',
-     Vector3(0.0, 8.0, 0.0),
-     Vector3(0.0, 0.0, 0.0),
-     DisplayVoxel(Vector3(-4.0, 0.0, -4.0), Vector3(8.0, 8.0, 8.0),
-                  'diamond_hoe{CustomModelData:100}')
-     ),
-    ('hip',
-     'body',
-        Vector3(0.0, 12.0, 0.0),
-        Vector3(0.0, 0.0, 0.0),
-        DisplayVoxel(Vector3(-4.0, 0.0, -2.0), Vector3(8.0, 12.0, 4.0),
-                     'diamond_hoe{CustomModelData:101}')
-     ),
-    ('body',
-     'elbow_r',
-        Vector3(0.0, -5.0, 0.0),
-        Vector3(4.0, -1.0, 0.0),
-        DisplayVoxel(Vector3(0.0, -5.0, -2.0), Vector3(4.0, 6.0, 4.0),
-                     'diamond_hoe{CustomModelData:102}')
-     ),
-    ('elbow_r',
-     'wrist_r',
-        Vector3(0.0, -4.0, 0.0),
-        Vector3(2.0, 0.0, 0.0),
-        DisplayVoxel(Vector3(-2.0, -6.0, -2.0), Vector3(4.0, 6.0, 4.0),
-                     'diamond_hoe{CustomModelData:103}')
-        # )
-     ),
-    ('body',
-     'elbow_l',
-        Vector3(0.0, -5.0, 0.0),
-        Vector3(-4.0, -1.0, 0.0),
-        DisplayVoxel(Vector3(-4.0, -5.0, -2.0), Vector3(4.0, 6.0, 4.0),
-                     'diamond_hoe{CustomModelData:104}')
-     ),
-    ('elbow_l',
-     'wrist_l',
-        Vector3(0.0, -4.0, 0.0),
-        Vector3(-2.0, 0.0, 0.0),
-        DisplayVoxel(Vector3(-2.0, -6.0, -2.0), Vector3(4.0, 6.0, 4.0),
-                     'diamond_hoe{CustomModelData:105}')
-        # )
-     ),
-    ('body',
-     'knee_r',
-        Vector3(0.0, -6.0, 0.0),
-        Vector3(2.0, -12.0, 0.0),
-        DisplayVoxel(Vector3(-2.0, -6.0, -2.0), Vector3(4.0, 6.0, 4.0),
-                     'diamond_hoe{CustomModelData:106}')
-     ),
-    ('knee_r',
-     'ankle_r',
-        Vector3(0.0, -6.0, 0.0),
-        Vector3(0.0, 0.0, -2.0),
-        DisplayVoxel(Vector3(-2.0, -6.0, 0.0), Vector3(4.0, 6.0, 4.0),
-                     'diamond_hoe{CustomModelData:107}')
-     ),
-    ('body',
-     'knee_l',
-        Vector3(0.0, -6.0, 0.0),
-        Vector3(-2.0, -12.0, 0.0),
-        DisplayVoxel(Vector3(-2.0, -6.0, -2.0), Vector3(4.0, 6.0, 4.0),
-                     'diamond_hoe{CustomModelData:108}')
-     ),
-    ('knee_l',
-     'ankle_l',
-        Vector3(0.0, -6.0, 0.0),
-        Vector3(0.0, 0.0, -2.0),
-        DisplayVoxel(Vector3(-2.0, -6.0, 0.0), Vector3(4.0, 6.0, 4.0),
-                     'diamond_hoe{CustomModelData:109}')
-     ),
-    (
-        'root',
-        'hip'
-    )
-]
-
-
-def generate(src, song_name=""):
-    # Get filename
-    filename = src.split('/')[-1].split('.')[0]
-
-    file_loader = BvhFileLoader(src, scale=0.1, order='xyz',
-                                face_north=Quaternion().set_from_euler(Euler('xyz', 0.0, 0.0, 0.0)))
-    model = file_loader.get_model()
-    animation = file_loader.get_animation()
-
-    m = MinecraftModelCreator()
-    m.set_bones(bone_list)
+RIG_PATH = "./data/rigs/"
+DEFAULT_RIG = "pjsekai"
+
+_rigs = {}
+
+
+def get_rig(name=DEFAULT_RIG):
+    """Return the rig profile data/rigs/{name}.json, loaded once per run."""
+    if name not in _rigs:
+        _rigs[name] = load_rig(os.path.join(RIG_PATH, f"{name}.json"))
+    return _rigs[name]
+
+
+def track_rigs(song_name, srcs, settings):
+    """Return the rig of every track of a song. Track 01 belongs to the first character of the song in the
+    registry, and so on. Settings: "rig" is the default rig, "character_rigs" maps characters to rigs."""
+    default = settings.get("rig", DEFAULT_RIG)
+    character_rigs = settings.get("character_rigs", {})
+    registry = SongRegistry()
+    characters = registry.characters(song_name) if song_name in registry.songs else []
+
+    rigs = {}
+    for src in srcs:
+        filename = src.split('/')[-1].split('.')[0]
+        index = int(filename) - 1 if filename.isdigit() else -1
+        character = characters[index] if 0 <= index < len(characters) else None
+        rigs[src] = get_rig(character_rigs.get(character, default))
+    return rigs
+
+
+def generate(src, song_name="", stats=None):
+    generate_song([src], song_name, stats)
+
+
+def generate_song(srcs, song_name="", stats=None, segment_seconds=None, rigs=None):
+    """Export every character track of a song. The exporter is set up once and shared by all tracks, the
+    Minecraft model is built per track from its rig ({src: RigProfile}, the default rig if missing).
+    Each stage is recorded to stats, a StageRecorder.
+    With segment_seconds, every track is split into animations of that many seconds."""
+    stats = stats or StageRecorder("mcmv")
+    rigs = rigs or {}
 
     b = BedrockModelExporter()
-    b.set_model_info(model, m.minecraft_model, translation)
+
     # Make directory
     dir = f"./RP/animations/songs/{song_name}/"
     if not os.path.exists(dir):
         os.makedirs(dir)
-    b.write_animation(dir, f"{filename}",
-                      BedrockAnimFileFormatter('1.8.0', f"animation.{song_name}.{filename}"), animation)
-    # Scale animation
-    mcmv_scale.fix_empty(dir + f"{filename}.animation.json")
-    mcmv_scale.hip_scale(dir + f"{filename}.animation.json", 20)
+
+    # Tracks last as long as the song's audio, when there is one
+    duration = sound_duration(song_name) if os.path.exists("./RP/sounds/sound_definitions.json") else None
+    animation_length = round(duration, 4) if duration else None
+
+    for src in srcs:
+        # Get filename
+        filename = src.split('/')[-1].split('.')[0]
+        path = dir + f"{filename}.animation.json"
+        print(f"[INFO] Generating {filename} for {song_name}")
+
+        with stats.stage("parse", song_name, src) as record:
+            file_loader = BvhFileLoader(src, scale=0.1, order='xyz',
+                                        face_north=Quaternion().set_from_euler(Euler('xyz', 0.0, 0.0, 0.0)))
+            model = file_loader.get_model()
+            animation = file_loader.get_animation()
+            record["frames"] = len(animation.frames)
+            record["bytes"] = stats.path_size(src)
+
+        with stats.stage("retarget", song_name, src) as record:
+            rig = rigs.get(src) or get_rig()
+            minecraft_model = rig.minecraft_model()
+            b.set_model_info(model, minecraft_model, rig.translation)
+            track = rig.retarget_plan(b.original_model, minecraft_model).get_pose_track(b.original_model, animation)
+            record["frames"] = len(track)
+
+        # Drop the files of an earlier export, which may have been split differently
+        for file in os.listdir(dir):
+            if file == f"{filename}.animation.json" or \
+                    file.startswith(f"{filename}.") and file.endswith(".animation.json"):
+                os.remove(os.path.join(dir, file))
+
+        # Bones are converted and streamed to the file one at a time, so serializing includes the write
+        with stats.stage("serialize", song_name, path) as record:
+            paths = b.write_pose_track(dir, f"{filename}",
+                                       BedrockAnimFileFormatter('1.8.0', f"animation.{song_name}.{filename}",
+                                                                precision=4, sparse=True),
+                                       track, animation_length=animation_length, segment_seconds=segment_seconds)
+            record["frames"] = len(track)
+            record["bytes"] = sum(stats.path_size(x) for x in paths)
 
 
 # Check if has args
 print(sys.argv)
 if len(sys.argv) > 1:
     data = json.loads(sys.argv[1])
+    stats = StageRecorder("mcmv", data)
     for song in data["songs"].keys():
         path = data["songs"][song]["path"]
-        for file in os.listdir(path):
-            if file.endswith(".bvh"):
-                print(f"[INFO] Generating {file} for {song}")
-                generate(os.path.join(path, file), song)
+        files = sorted(os.listdir(path))
+        tracks = [os.path.join(path, file) for file in files if file.endswith(".bvh")]
+        if tracks:
+            generate_song(tracks, song, stats, data.get("segment_seconds"), track_rigs(song, tracks, data))
+        for file in files:
             if file.endswith(".vmd"):
                 print("VMD!")
-                cam.convert(os.path.join(path, file), song)
+                with stats.stage("camera", song, os.path.join(path, file)) as record:
+                    record["frames"] = cam.convert(os.path.join(path, file), song,
+                                                   segment_seconds=data.get("camera_segment_seconds"))
+                    record["bytes"] = stats.path_size(f"./BP/functions/songs/{song}")
+    stats.finish()
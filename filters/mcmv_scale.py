@@ -11,12 +11,18 @@ def hip_scale(file, multiplier=10):
     key = list(data["animations"].keys())[0]
     hip = data["animations"][key]["bones"]["hip"]
 
-    # Loop each keyframe
-    for keyframe in hip["position"]:
-        # Loop each axis
-        for axis in range(len(hip["position"][keyframe])):
-            # Multiply the value by 10
-            hip["position"][keyframe][axis] *= multiplier
+    def scale(values):
+        # Multiply every axis
+        return [x * multiplier for x in values]
+
+    # A sparse file keeps a constant position as a single value, and may leave it out
+    position = hip.get("position", {})
+    if isinstance(position, list):
+        hip["position"] = scale(position)
+    else:
+        # Loop each keyframe
+        for keyframe in position:
+            position[keyframe] = scale(position[keyframe])
 
     # Write the file
     with open(file, "w") as f:
@@ -1,3 +1,275 @@
 import json
 import os
+import re
 import sys
+import uuid
+
+from audio import sound_duration
+from song_registry import SongRegistry, add_select_states
+
+# Generates everything the song_manager runs from the song registry (id, characters, sound, camera):
+# BP/animation_controllers/song_manager.ac.json, the song events of BP/entities/song_manager.json,
+# BP/functions/songs.mcfunction, the BP/functions/songs/{song}.mcfunction start functions and the
+# BP/scripts/song_clock.js camera resync with its script module in BP/manifest.json.
+
+STAGE = "execute rotated 0 0 positioned ^^^10"
+CAMERA_END_PATTERN = re.compile(r"matches (?:\.\.)?(\d+) run scoreboard players (?:add|set)")
+SCRIPT_API_VERSION = "1.2.0"
+# Runs every tick and checks the camera score of every player against the wall clock. The first time a player has
+# a score, and when the score goes down on a replay, its start is taken from it, and at every checkpoint a score 2 or more ticks behind the elapsed time is
+# moved to it, so a lagging server skips ahead instead of stretching the show. The game time can not be used,
+# q.life_time and the tick counters advance one tick per tick however long the tick takes.
+SONG_CLOCK = """import { system, world } from "@minecraft/server";
+
+const SONGS = %s;
+const clocks = new Map();
+
+function getScore(objective, player) {
+    try {
+        return player.scoreboardIdentity === undefined ? undefined : objective.getScore(player.scoreboardIdentity);
+    } catch {
+        return undefined;
+    }
+}
+
+system.runInterval(() => {
+    const now = Date.now();
+    for (const song in SONGS) {
+        const objective = world.scoreboard.getObjective(song);
+        for (const player of world.getAllPlayers()) {
+            const key = player.id + " " + song;
+            const score = objective === undefined ? undefined : getScore(objective, player);
+            if (score === undefined) {
+                clocks.delete(key);
+                continue;
+            }
+            const clock = clocks.get(key);
+            // A score that went down is a replay, /function songs/<song> restarts it without resetting it
+            if (clock === undefined || score < clock.score) {
+                clocks.set(key, { start: now - (score - 1) * 50, next: 0, score: score });
+                continue;
+            }
+            clock.score = score;
+            const checkpoints = SONGS[song].checkpoints;
+            const elapsed = (now - clock.start) / 1000;
+            if (clock.next >= checkpoints.length || elapsed < checkpoints[clock.next]) {
+                continue;
+            }
+            while (clock.next < checkpoints.length && elapsed >= checkpoints[clock.next]) {
+                clock.next++;
+            }
+            const target = Math.min(Math.round(elapsed * 20) + 1, SONGS[song].camera);
+            if (score <= target - 2) {
+                player.runCommandAsync(`scoreboard players set @s ${song} ${target}`);
+            }
+        }
+    }
+});
+"""
+
+
+def camera_length(song):
+    """Return the last score the camera function of the song runs at, or None if the song has no camera."""
+    path = f"./BP/functions/songs/{song}/camera.mcfunction"
+    if not os.path.exists(path):
+        return None
+    # A segmented camera increments the score in its segment files
+    segments = f"./BP/functions/songs/{song}/camera/"
+    paths = [path] + ([os.path.join(segments, x) for x in os.listdir(segments) if x.startswith("segment")]
+                      if os.path.isdir(segments) else [])
+    ends = []
+    for file_path in paths:
+        with open(file_path, "r") as f:
+            ends += [int(x) for x in CAMERA_END_PATTERN.findall(f.read())]
+    return max(ends, default=None)
+
+
+def load_sounds(path="./RP/sounds/sound_definitions.json"):
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r") as f:
+        return set(json.load(f)["sound_definitions"])
+
+
+def manifest(registry):
+    """Return {song: {"id", "characters", "sound", "duration", "camera"}} for every registered song, ordered by id.
+    duration is the length in seconds of the song's OGG file."""
+    sounds = load_sounds()
+    songs = {}
+    for song, entry in registry.items():
+        sound = entry.get("sound", song)
+        songs[song] = {
+            "id": entry["id"],
+            "characters": entry["characters"],
+            "sound": sound if sound in sounds else None,
+            "duration": sound_duration(sound) if sound in sounds else None,
+            "camera": camera_length(song)
+        }
+        if songs[song]["sound"] is None:
+            print(f"[WARN] {song} has no sound {sound}")
+    return songs
+
+
+def checkpoints(info, interval):
+    """Return (seconds, camera score) of every resync checkpoint of a song, every interval seconds of the audio."""
+    if not info["camera"] or not info["duration"] or not interval:
+        return []
+    points = []
+    seconds = interval
+    # The camera score is 1 when the song starts and goes up by one every tick
+    while seconds < info["duration"] and round(seconds * 20) + 1 <= info["camera"]:
+        points.append((seconds, round(seconds * 20) + 1))
+        seconds = interval * (len(points) + 1)
+    return points
+
+
+def song_states(song, info):
+    """Return the states of a song in the song_manager controller.
+
+    {song} summons the cast, {song}.1 starts the sound and the camera and {song}.stop tears the song down once
+    pj:song is changed. The camera is kept in time with the sound by song_clock.js.
+    """
+    summon = [f"/{STAGE} as @e[family=pjsekai,r=1] run event entity @s despawn"] + [
+        f"/{STAGE} run summon {character} ~~~ ~~ song_ch.{i + 1}" for i, character in enumerate(info["characters"])
+    ]
+    play = [f"/{STAGE} as @e[family=pjsekai,r=1] run event entity @s song:{song}"]
+    stop = [f"/{STAGE} as @e[family=pjsekai,r=1] run event entity @s despawn"]
+    if info["sound"]:
+        play.append(f"/playsound {info['sound']} @a")
+        stop.append(f"/stopsound @a {info['sound']}")
+    if info["camera"]:
+        # Start the camera, and stop it when the song is left before it ends
+        play.append(f"/execute as @a run scoreboard players set @s {song} 1")
+        # The camera compares the score with the last one it ran at to catch up after a skip
+        play.append(f"/execute as @a run scoreboard players set @s {song}_last 0")
+        stop.append(f"/scoreboard players reset @a {song}")
+
+    states = {
+        song: {
+            "on_entry": summon + ["v.time = q.life_time + 1;"],
+            "transitions": [
+                {f"{song}.1": "q.life_time >= v.time"}
+            ]
+        },
+        f"{song}.1": {
+            "on_entry": play,
+            "transitions": [
+                {f"{song}.stop": f"q.property('pj:song') != {info['id']}"}
+            ]
+        },
+        f"{song}.stop": {
+            "on_entry": stop,
+            "transitions": [
+                {"default": "1"}
+            ]
+        }
+    }
+    return states
+
+
+def generate_song_manager(songs, ac_path="./BP/animation_controllers/song_manager.ac.json"):
+    states = {
+        "default": {
+            "transitions": [
+                {"select": "q.property('pj:song') != 0"}
+            ]
+        }
+    }
+    add_select_states(states, "select", "q.property('pj:song')", [(info["id"], song) for song, info in songs.items()])
+    for song, info in songs.items():
+        states.update(song_states(song, info))
+
+    data = {
+        "format_version": "1.20.0",
+        "animation_controllers": {
+            "controller.animation.song_manager": {
+                "states": states
+            }
+        }
+    }
+    with open(ac_path, "w") as f:
+        json.dump(data, f, indent=4)
+
+
+def generate_functions(songs, path="./BP/functions/"):
+    # Only songs with a camera are dispatched every tick, and only while their camera runs
+    lines = [
+        f"execute as @a if score @s {song} matches 1..{info['camera']} run function songs/{song}/camera"
+        for song, info in songs.items() if info["camera"]
+    ]
+    with open(os.path.join(path, "songs.mcfunction"), "w") as f:
+        f.write("\n".join(lines))
+
+    os.makedirs(os.path.join(path, "songs"), exist_ok=True)
+    for song, info in songs.items():
+        lines = [
+            f"scoreboard objectives add {song} dummy",
+            f"scoreboard objectives add {song}_last dummy",
+            f"scoreboard objectives add {song}_gap dummy"
+        ] if info["camera"] else []
+        # Killing the song_manager skips {song}.stop, so the cameras of the song that played, and of this one on a
+        # replay, are stopped here. At most one camera runs at a time, which cost_analyzer's "exclusive" relies on
+        lines += [f"scoreboard players reset @a {other}" for other, other_info in songs.items() if other_info["camera"]]
+        lines += [
+            "kill @e[type=pj:song_manager]",
+            "kill @e[family=pjsekai]",
+            f"summon pj:song_manager ~~~ 0 0 song:{song}",
+            "stopsound @a",
+            "gamemode spectator @a",
+            "effect @a invisibility 999999 0 true"
+        ]
+        with open(os.path.join(path, "songs", f"{song}.mcfunction"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def generate_song_clock(songs, interval=10, path="./BP/scripts/song_clock.js", manifest_path="./BP/manifest.json"):
+    """Write song_clock.js for the songs with resync checkpoints and add its script module to the manifest.
+    Without any checkpoint the script and its module are removed."""
+    clock = {}
+    for song, info in songs.items():
+        points = checkpoints(info, interval)
+        if points:
+            clock[song] = {"camera": info["camera"], "checkpoints": [seconds for seconds, _ in points]}
+
+    with open(manifest_path, "r") as f:
+        data = json.load(f)
+    data["modules"] = [x for x in data["modules"] if x["type"] != "script"]
+    data["dependencies"] = [x for x in data.get("dependencies", []) if x.get("module_name") != "@minecraft/server"]
+    if clock:
+        data["modules"].append({
+            "type": "script",
+            "language": "javascript",
+            # Derived from the pack so every build has the same module
+            "uuid": str(uuid.uuid5(uuid.UUID(data["header"]["uuid"]), "song_clock")),
+            "entry": "scripts/song_clock.js",
+            "version": [1, 0, 0]
+        })
+        data["dependencies"].append({"module_name": "@minecraft/server", "version": SCRIPT_API_VERSION})
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(SONG_CLOCK % json.dumps(clock))
+    elif os.path.exists(path):
+        os.remove(path)
+    with open(manifest_path, "w") as f:
+        json.dump(data, f, indent=4)
+    return clock
+
+
+settings = json.loads(sys.argv[1]) if len(sys.argv) > 1 else {}
+
+registry = SongRegistry()
+registry.discover("./RP/animations/songs/", "./data/mcmv/")
+registry.seed_characters("./BP/animation_controllers/song_manager.ac.json")
+if "entities" in settings:
+    registry.resolve_characters(settings["entities"])
+
+songs = manifest(registry)
+registry.inject_events("./BP/entities/song_manager.json")
+generate_song_manager(songs)
+generate_functions(songs)
+# Seconds between the resync checkpoints of the camera, 0 turns them off
+clock = generate_song_clock(songs, settings.get("checkpoint_seconds", 10))
+registry.save()
+
+print(f"[INFO] Generated song_manager for {len(songs)} songs, "
+      f"{sum(1 for x in songs.values() if x['camera'])} dispatched every tick, {len(clock)} resynced")
@@ -2,14 +2,43 @@ import os
 import json
 import sys
 
+from instrumentation import StageRecorder
+from song_registry import SongRegistry, add_select_states
+
 # By default, the songs are from "./RP/animations/songs/"
 
-songs = os.listdir("./RP/animations/songs/")
 
-song_dict = {
-    "hitorinbo_envy": 74,
-    "villain": 170,
-}
+def index_songs(path="./RP/animations/songs/"):
+    """Return {song: {track: [animation names]}} for every song folder, so the folders are only scanned once.
+    A track is a single animation named after it, or segments {track}.0, {track}.1, ... played one after another."""
+    index = {}
+    for song in sorted(os.listdir(path)):
+        tracks = index.setdefault(song, {})
+        for file in os.listdir(os.path.join(path, song)):
+            name = file.split(".animation")[0]
+            tracks.setdefault(name.split(".")[0], []).append(name)
+        for names in tracks.values():
+            names.sort(key=lambda x: int(x.split(".")[1]) if "." in x else 0)
+        index[song] = dict(sorted(tracks.items()))
+    return index
+
+
+def segment_length(song, name, path="./RP/animations/songs/"):
+    """Return the animation_length of an animation of a song."""
+    with open(os.path.join(path, song, f"{name}.animation.json"), "r") as f:
+        data = json.load(f)
+    return data["animations"][f"animation.{song}.{name}"]["animation_length"]
+
+
+settings = json.loads(sys.argv[1]) if len(sys.argv) > 1 else {}
+stats = StageRecorder("song_injector", settings)
+
+with stats.stage("parse"):
+    songs = index_songs()
+
+    registry = SongRegistry()
+    registry.discover("./RP/animations/songs/", "./data/mcmv/")
+    registry.seed_characters("./BP/animation_controllers/song_manager.ac.json")
 
 
 def inject_rp(entity_path):
@@ -17,103 +46,115 @@ def inject_rp(entity_path):
         data = json.load(f)
 
     # Loop songs
-    for song in songs:
-        # Get song animations
-        song_animations = [x.split(".")[0] for x in os.listdir(
-            f"./RP/animations/songs/{song}/")]
+    for song, tracks in songs.items():
+        with stats.stage("inject_rp", song, entity_path):
+            # Convert to dict, so will be: {"song.song_animation": "song_animation"}
+            song_animations = {
+                f"{song}.{x}": f"animation.{song}.{x}" for names in tracks.values() for x in names}
 
-        # Convert to dict, so will be: {"song.song_animation": "song_animation"}
-        song_animations = {
-            f"{song}.{x}": f"animation.{song}.{x}" for x in song_animations}
-
-        data["minecraft:client_entity"]["description"]["animations"].update(
-            song_animations)
+            data["minecraft:client_entity"]["description"]["animations"].update(
+                song_animations)
 
     # Write the file
-    with open(entity_path, "w") as f:
-        json.dump(data, f, indent=4)
+    with stats.stage("write_rp", file=entity_path) as record:
+        with open(entity_path, "w") as f:
+            json.dump(data, f, indent=4)
+        record["bytes"] = stats.path_size(entity_path)
 
 
 def inject_bp(entity_path):
-    # Inject bp events
-    for k, v in song_dict.items():
-        inject_bp_events(entity_path, {
-            f"song:{k}": {
-                "set_property": {
-                    "pj:song": v
-                }
-            }
-        })
-
-
-def inject_bp_events(entity_path, event):
-    with open(entity_path, "r") as f:
-        data = json.load(f)
-
-    data["minecraft:entity"]["events"].update(event)
-
-    with open(entity_path, "w") as f:
-        json.dump(data, f, indent=4)
+    # Inject every song event with a single write
+    registry.inject_events(entity_path)
 
 
 def generate_ac():
     ac_path = "./RP/animation_controllers/songs.ac.json"
     with open(ac_path, "r") as f:
         data = json.load(f)
+    states = data["animation_controllers"]["controller.animation.songs"]["states"]
 
-    for song in songs:
-        song_animations = [x.split(".")[0] for x in os.listdir(
-            f"./RP/animations/songs/{song}/")]
-
-        song_id = song_dict[song]
-
-        # Create state
-        data["animation_controllers"]["controller.animation.songs"]["states"][song] = {
-            "transitions": [
-                {
-                    f"{song}.{x}": f"q.property('pj:song_ch') == {int(x)}"
-                } for x in song_animations
-            ] + [
-                {
-                    "default": f"q.property('pj:song_ch') != {song_id}"
-                }
-            ]
-        }
-
-        # Add to default
-        data["animation_controllers"]["controller.animation.songs"]["states"]["default"]["transitions"].append(
-            {
-                song: f"q.property('pj:song') == {song_id}"
-            }
-        )
+    # Idle entities only check that no song is set, the song is then looked up through range states
+    states["default"]["transitions"] = [
+        {"select": "q.property('pj:song') != 0"}
+    ]
+    song_frames = add_select_states(states, "select", "q.property('pj:song')", [
+        (registry.id(song), song) for song in sorted(songs, key=registry.id)
+    ])
 
-        # Create for every song_anims
-        for song_animation in song_animations:
-            data["animation_controllers"]["controller.animation.songs"]["states"][f"{song}.{song_animation}"] = {
+    channel_frames = 0
+    for song, tracks in songs.items():
+        with stats.stage("generate_ac", song, ac_path):
+            channel_frames = max(channel_frames, song_states(states, song, tracks))
+
+    worst = max(len(x.get("transitions", [])) for x in states.values())
+    print(f"[INFO] songs.ac.json: {len(states)} states, at most {worst} conditions per frame, "
+          f"a track starts {1 + song_frames + channel_frames} frames after pj:song is set")
+
+    # Write the file
+    with stats.stage("write_ac", file=ac_path) as record:
+        with open(ac_path, "w") as f:
+            json.dump(data, f, indent=4)
+        record["bytes"] = stats.path_size(ac_path)
+
+
+def song_states(states, song, tracks):
+    """Add the states of a song to the songs controller and return the frames its channel lookup takes."""
+    song_id = registry.id(song)
+    if len(tracks) > len(registry.characters(song)):
+        print(f"[WARN] {song} has {len(tracks)} tracks but only {len(registry.characters(song))} characters")
+
+    # The song state looks up the track of the character
+    channel_frames = add_select_states(states, song, "q.property('pj:song_ch')", [
+        (int(x), f"{song}.{x}") for x in tracks
+    ])
+
+    # Create for every song_anims
+    for track, names in tracks.items():
+        leave = {"default": f"q.property('pj:song') != {song_id}"}
+        if names == [track]:
+            states[f"{song}.{track}"] = {
                 "animations": [
-                    f"{song}.{song_animation}",
+                    f"{song}.{track}",
                     "fix"
                 ],
-                "transitions": [
-                    {
-                        "default": f"q.property('pj:song') != {song_id}"
-                    }
-                ]
+                "transitions": [leave]
             }
-
-    # Write the file
-    with open(ac_path, "w") as f:
-        json.dump(data, f, indent=4)
+            continue
+
+        # Segments switch on the time since the first one started, so a late switch does not add up
+        length = segment_length(song, names[0])
+        for k, name in enumerate(names):
+            state = f"{song}.{track}" if k == 0 else f"{song}.{name}"
+            states[state] = {
+                "on_entry": ["v.song_start = q.life_time;"] if k == 0 else [],
+                "animations": [
+                    f"{song}.{name}",
+                    "fix"
+                ],
+                "transitions": [leave]
+            }
+            if k < len(names) - 1:
+                states[state]["transitions"].append(
+                    {f"{song}.{names[k + 1]}": f"q.life_time >= v.song_start + {length * (k + 1):g}"})
+    return channel_frames
 
 
 # Check if has args
 print(sys.argv)
 if len(sys.argv) > 1:
-    data = json.loads(sys.argv[1])
+    data = settings
+    registry.resolve_characters(data["entities"])
     for entity_dir in data["entities"]:
         for entity in os.listdir(f"./RP/entity/{entity_dir}/"):
-            inject_rp(f"./RP/entity/{entity_dir}/{entity}")
+            path = f"./RP/entity/{entity_dir}/{entity}"
+            inject_rp(path)
         for entity in os.listdir(f"./BP/entities/{entity_dir}/"):
-            inject_bp(f"./BP/entities/{entity_dir}/{entity}")
+            path = f"./BP/entities/{entity_dir}/{entity}"
+            # The events of every song are injected with one write, so this stage has no song
+            with stats.stage("inject_bp", file=path) as record:
+                inject_bp(path)
+                record["bytes"] = stats.path_size(path)
 
 generate_ac()
+registry.save()
+stats.finish()
@@ -0,0 +1,167 @@
+import math
+import os
+import re
+import json
+
+# Persisted song registry, by default "./data/song_registry.json":
+# {"songs": {"villain": {"id": 2, "characters": ["25ji:mafuyu", "25ji:mizuki"]}}}
+# The registry owns the value of the pj:song property for every song, so ids stay the same between builds
+# and the property range can stay as tight as the number of songs.
+
+SUMMON_PATTERN = re.compile(r"summon\s+(\S+)\s.*song_ch\.(\d+)")
+
+
+def add_select_states(states, name, query, leaves, fanout=2):
+    """Add state `name` that moves to the state of `leaves` ([(value, state)] sorted by value) matching `query`.
+
+    Above `fanout` leaves the state splits the values in two ranges, so every state holds at most fanout + 1
+    conditions and a leaf is reached in log2 frames. Returns the number of frames taken to reach a leaf.
+    """
+    if len(leaves) <= fanout:
+        # Unknown values fall back to default instead of waiting here
+        states[name] = {
+            "transitions": [
+                {state: f"{query} == {value}"} for value, state in leaves
+            ] + [
+                {"default": "1"}
+            ]
+        }
+        return 1
+
+    half = len(leaves) // 2
+    left, right = leaves[:half], leaves[half:]
+    left_name = f"{name}.{left[0][0]}_{left[-1][0]}"
+    right_name = f"{name}.{right[0][0]}_{right[-1][0]}"
+    states[name] = {
+        "transitions": [
+            {left_name: f"{query} <= {left[-1][0]}"},
+            {right_name: f"{query} > {left[-1][0]}"}
+        ]
+    }
+    return 1 + max(add_select_states(states, left_name, query, left, fanout),
+                   add_select_states(states, right_name, query, right, fanout))
+
+
+def parse_range(text):
+    """Return (low, high) of a `matches` range such as 5, 1.., ..5 or 1..5."""
+    if ".." not in text:
+        return int(text), int(text)
+    low, high = text.split("..")
+    return int(low) if low else -math.inf, int(high) if high else math.inf
+
+
+class SongRegistry:
+    def __init__(self, path="./data/song_registry.json"):
+        self.path = path
+        self.songs = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.songs = json.load(f).get("songs", {})
+
+    def discover(self, *roots):
+        """Register every song folder found under the given roots and return the sorted song names.
+
+        Songs that are new to the registry get the smallest unused id, existing songs keep theirs.
+        """
+        found = set()
+        for root in roots:
+            if not os.path.isdir(root):
+                continue
+            for song in os.listdir(root):
+                if os.path.isdir(os.path.join(root, song)):
+                    found.add(song)
+
+        for song in sorted(found):
+            if song not in self.songs:
+                self.songs[song] = {"id": self.next_id(), "characters": []}
+                print(f"[INFO] Registered song {song} with id {self.songs[song]['id']}")
+        return sorted(found)
+
+    def next_id(self):
+        used = {x["id"] for x in self.songs.values()}
+        song_id = 1
+        while song_id in used:
+            song_id += 1
+        return song_id
+
+    def id(self, song):
+        return self.songs[song]["id"]
+
+    def characters(self, song):
+        return self.songs[song]["characters"]
+
+    def max_id(self):
+        return max((x["id"] for x in self.songs.values()), default=0)
+
+    def items(self):
+        """Return (song, entry) pairs ordered by id."""
+        return sorted(self.songs.items(), key=lambda x: x[1]["id"])
+
+    def seed_characters(self, ac_path):
+        """Take the cast of songs without characters from the summon commands of the song_manager controller."""
+        if not os.path.exists(ac_path):
+            return
+        with open(ac_path, "r") as f:
+            states = json.load(f)["animation_controllers"]["controller.animation.song_manager"]["states"]
+
+        for song, entry in self.songs.items():
+            if entry["characters"] or song not in states:
+                continue
+            cast = {}
+            for command in states[song].get("on_entry", []):
+                match = SUMMON_PATTERN.search(command)
+                if match:
+                    cast[int(match.group(2))] = match.group(1)
+            entry["characters"] = [cast[x] for x in sorted(cast)]
+
+    def resolve_characters(self, entity_dirs, bp_path="./BP/entities/"):
+        """Resolve character names to entity identifiers of the given BP entity folders.
+
+        A character may be written as its identifier ("25ji:mizuki") or as its file name ("mizuki").
+        Raises ValueError for characters that are not an entity of those folders.
+        """
+        identifiers = {}
+        for entity_dir in entity_dirs:
+            for entity in sorted(os.listdir(os.path.join(bp_path, entity_dir))):
+                with open(os.path.join(bp_path, entity_dir, entity), "r") as f:
+                    identifier = json.load(f)["minecraft:entity"]["description"]["identifier"]
+                identifiers[identifier] = identifier
+                identifiers.setdefault(entity.split(".")[0], identifier)
+
+        for song, entry in self.songs.items():
+            unknown = [x for x in entry["characters"] if x not in identifiers]
+            if unknown:
+                raise ValueError(f"Song {song} uses unknown characters {unknown}")
+            entry["characters"] = [identifiers[x] for x in entry["characters"]]
+
+    def events(self):
+        """Return the song:{song} entity events setting pj:song to the song id."""
+        return {
+            f"song:{song}": {
+                "set_property": {
+                    "pj:song": entry["id"]
+                }
+            } for song, entry in self.items()
+        }
+
+    def inject_events(self, entity_path):
+        """Replace the song events of a BP entity and keep its pj:song range as small as the registry allows."""
+        with open(entity_path, "r") as f:
+            data = json.load(f)
+
+        # Drop song events with stale ids before adding the registry ones
+        events = data["minecraft:entity"]["events"]
+        for name in [x for x in events if x.startswith("song:")]:
+            del events[name]
+        events.update(self.events())
+
+        properties = data["minecraft:entity"]["description"].get("properties", {})
+        if "pj:song" in properties:
+            properties["pj:song"]["range"] = [0, max(self.max_id(), 1)]
+
+        with open(entity_path, "w") as f:
+            json.dump(data, f, indent=4)
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump({"songs": dict(self.items())}, f, indent=4)
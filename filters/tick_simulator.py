@@ -0,0 +1,466 @@
+import argparse
+import json
+import math
+import os
+import re
+
+from song_registry import parse_range
+
+# Offline interpreter for the subset of commands the generators emit: scoreboard objectives/players/operation,
+# execute as/at/positioned/rotated/if/unless score/if entity, function, summon, kill and camera ... set, which is
+# recorded as an event instead of moving a camera. Other commands are counted and otherwise ignored.
+# Selectors take the type, name, family (read from the pack's entity files), tag, r, rm, x, y, z and c arguments,
+# any other argument is an error. The camera resync of BP/scripts/song_clock.js is emulated on a wall clock
+# that advances tick_ms milliseconds every tick, 50 for a server that keeps up and more for a lagging one.
+#
+#     python filters/tick_simulator.py --bp ./BP --setup songs/villain --score villain=1 --ticks 400
+#
+# runs songs/villain once, sets the villain score of every player to 1 and then runs the tick.json functions
+# for 400 ticks, printing the camera timeline and the commands run per tick. With --tick-ms 60 the ticks take
+# 60 ms and the camera is moved ahead at every checkpoint.
+
+COORDINATE_PATTERN = re.compile(r"[~^]?-?(?:\d+\.?\d*|\.\d+)?")
+
+
+def local_to_world(position, rotation, left, up, forward):
+    """Return the world position of the local coordinates ^left ^up ^forward, as Minecraft computes them."""
+    yaw, pitch = rotation
+    f2 = math.cos(math.radians(yaw + 90))
+    f3 = math.sin(math.radians(yaw + 90))
+    f4 = math.cos(math.radians(-pitch))
+    f5 = math.sin(math.radians(-pitch))
+    f6 = math.cos(math.radians(-pitch + 90))
+    f7 = math.sin(math.radians(-pitch + 90))
+    forward_vector = (f2 * f4, f5, f3 * f4)
+    up_vector = (f2 * f6, f7, f3 * f6)
+    # left = -(forward x up)
+    left_vector = (
+        -(forward_vector[1] * up_vector[2] - forward_vector[2] * up_vector[1]),
+        -(forward_vector[2] * up_vector[0] - forward_vector[0] * up_vector[2]),
+        -(forward_vector[0] * up_vector[1] - forward_vector[1] * up_vector[0])
+    )
+    return tuple(position[i] + forward_vector[i] * forward + up_vector[i] * up + left_vector[i] * left
+                 for i in range(3))
+
+
+class Entity:
+    def __init__(self, name: str, entity_type: str, position=(0.0, 0.0, 0.0), rotation=(0.0, 0.0),
+                 families=()):
+        self.name = name
+        self.type = entity_type
+        self.position = tuple(position)
+        self.rotation = tuple(rotation)
+        self.families = set(families)
+        self.tags = set()
+
+
+class Context:
+    def __init__(self, executor=None, position=(0.0, 0.0, 0.0), rotation=(0.0, 0.0)):
+        self.executor = executor
+        self.position = position
+        self.rotation = rotation
+
+    def copy(self, **changes):
+        context = Context(self.executor, self.position, self.rotation)
+        for key, value in changes.items():
+            setattr(context, key, value)
+        return context
+
+
+class TickSimulator:
+    # Selector arguments select() understands, any other one is an error rather than silently matching everything
+    SELECTOR_ARGUMENTS = {"type", "name", "family", "tag", "r", "rm", "x", "y", "z", "c"}
+
+    def __init__(self, functions_path="./BP/functions/", entities_path=None, tick_ms=50):
+        self.functions_path = functions_path
+        self.families = self.load_families(entities_path or os.path.join(functions_path, "..", "entities"))
+        self.song_clock = self.load_song_clock(os.path.join(functions_path, "..", "scripts", "song_clock.js"))
+        self.clocks = {}
+        self.tick_ms = tick_ms
+        self.functions = {}
+        self.entities = []
+        self.objectives = {}
+        self.tick_count = 0
+        self.commands = 0
+        self.camera_events = []
+        self.resyncs = []
+        self.ignored = {}
+
+    # World
+
+    @staticmethod
+    def load_families(path: str) -> dict:
+        """Return {identifier: families} of the entities of a behavior pack, for family= selectors."""
+        families = {}
+        for root, _, files in os.walk(path):
+            for file in files:
+                if not file.endswith(".json"):
+                    continue
+                with open(os.path.join(root, file), "r") as f:
+                    entity = json.load(f).get("minecraft:entity", {})
+                identifier = entity.get("description", {}).get("identifier")
+                family = entity.get("components", {}).get("minecraft:type_family", {}).get("family", [])
+                if identifier:
+                    families[identifier] = set(family)
+        return families
+
+    @staticmethod
+    def load_song_clock(path: str) -> dict:
+        """Return the SONGS table of a song_clock.js script, empty without the script."""
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r") as f:
+            match = re.search(r"^const SONGS = (.*);$", f.read(), re.MULTILINE)
+        return json.loads(match.group(1)) if match else {}
+
+    def add_player(self, name: str, position=(0.0, 0.0, 0.0), rotation=(0.0, 0.0)) -> Entity:
+        player = Entity(name, "minecraft:player", position, rotation, {"player"})
+        self.entities.append(player)
+        return player
+
+    def players(self):
+        return [x for x in self.entities if x.type == "minecraft:player"]
+
+    def get_score(self, holder: str, objective: str):
+        return self.objectives.get(objective, {}).get(holder)
+
+    def set_score(self, holder: str, objective: str, value: int):
+        self.objectives.setdefault(objective, {})[holder] = value
+
+    # Functions
+
+    def load_function(self, name: str) -> list:
+        if name not in self.functions:
+            path = os.path.join(self.functions_path, *name.split("/")) + ".mcfunction"
+            with open(path, "r") as f:
+                lines = [x.strip() for x in f.read().splitlines()]
+            self.functions[name] = [x for x in lines if x and not x.startswith("#")]
+        return self.functions[name]
+
+    def tick_functions(self) -> list:
+        with open(os.path.join(self.functions_path, "tick.json"), "r") as f:
+            return json.load(f).get("values", [])
+
+    def run_function(self, name: str, context: Context = None):
+        context = context or Context()
+        for line in self.load_function(name):
+            self.commands += 1
+            self.run_command(self.tokenize(line), context)
+
+    def tick(self, functions: list = None) -> int:
+        """Run the tick functions once and return the number of commands they ran."""
+        self.tick_count += 1
+        start = self.commands
+        for name in functions if functions is not None else self.tick_functions():
+            self.run_function(name)
+        self.run_song_clock()
+        return self.commands - start
+
+    def run_song_clock(self):
+        """Do what song_clock.js does at the end of the tick, its score changes are seen by the next tick."""
+        now = self.tick_count * self.tick_ms
+        for song, info in self.song_clock.items():
+            for player in self.players():
+                key = (player.name, song)
+                score = self.get_score(player.name, song)
+                if score is None:
+                    self.clocks.pop(key, None)
+                    continue
+                clock = self.clocks.get(key)
+                if clock is None or score < clock["score"]:
+                    self.clocks[key] = {"start": now - (score - 1) * 50, "next": 0, "score": score}
+                    continue
+                clock["score"] = score
+                checkpoints = info["checkpoints"]
+                elapsed = (now - clock["start"]) / 1000
+                if clock["next"] >= len(checkpoints) or elapsed < checkpoints[clock["next"]]:
+                    continue
+                while clock["next"] < len(checkpoints) and elapsed >= checkpoints[clock["next"]]:
+                    clock["next"] += 1
+                target = min(round(elapsed * 20) + 1, info["camera"])
+                if score <= target - 2:
+                    self.resyncs.append({"tick": self.tick_count, "player": player.name, "song": song,
+                                         "score": score, "target": target})
+                    self.set_score(player.name, song, target)
+
+    def run(self, ticks: int, functions: list = None) -> list:
+        """Run ticks ticks and return the number of commands of each."""
+        return [self.tick(functions) for _ in range(ticks)]
+
+    # Commands
+
+    @staticmethod
+    def tokenize(line: str) -> list:
+        # Keep selector arguments such as @e[type=x, c=1] in one token
+        tokens = []
+        depth = 0
+        for token in line.split():
+            if depth > 0:
+                tokens[-1] += " " + token
+            else:
+                tokens.append(token)
+            depth += token.count("[") - token.count("]")
+        return tokens
+
+    def run_command(self, tokens: list, context: Context):
+        if not tokens:
+            return
+        command = tokens[0].lstrip("/")
+        if command == "execute":
+            self.run_execute(tokens, 1, context)
+        elif command == "function":
+            self.run_function(tokens[1], context)
+        elif command == "scoreboard":
+            self.run_scoreboard(tokens, context)
+        elif command == "camera":
+            self.run_camera(tokens, context)
+        elif command == "summon":
+            self.run_summon(tokens, context)
+        elif command == "kill":
+            for entity in self.select(tokens[1], context):
+                self.entities.remove(entity)
+        else:
+            self.ignored[command] = self.ignored.get(command, 0) + 1
+
+    def run_execute(self, tokens: list, i: int, context: Context):
+        contexts = [context]
+        while i < len(tokens):
+            sub = tokens[i]
+            if sub == "run":
+                for branch in contexts:
+                    self.run_command(tokens[i + 1:], branch)
+                return
+            if sub == "as":
+                contexts = [x.copy(executor=e) for x in contexts for e in self.select(tokens[i + 1], x)]
+                i += 2
+            elif sub == "at":
+                contexts = [x.copy(position=e.position, rotation=e.rotation)
+                            for x in contexts for e in self.select(tokens[i + 1], x)]
+                i += 2
+            elif sub == "positioned":
+                if tokens[i + 1] == "as":
+                    contexts = [x.copy(position=e.position) for x in contexts for e in self.select(tokens[i + 2], x)]
+                    i += 3
+                else:
+                    values, i = self.read_coordinates(tokens, i + 1, 3)
+                    contexts = [x.copy(position=self.resolve_position(values, x)) for x in contexts]
+            elif sub == "rotated":
+                if tokens[i + 1] == "as":
+                    contexts = [x.copy(rotation=e.rotation) for x in contexts for e in self.select(tokens[i + 2], x)]
+                    i += 3
+                else:
+                    values, i = self.read_coordinates(tokens, i + 1, 2)
+                    contexts = [x.copy(rotation=self.resolve_rotation(values, x)) for x in contexts]
+            elif sub in ("if", "unless"):
+                expected = sub == "if"
+                if tokens[i + 1] == "score":
+                    low, high = parse_range(tokens[i + 5])
+                    # A context passes once, if any of the score holders matches
+                    contexts = [x for x in contexts if any(
+                        (score is not None and low <= score <= high)
+                        for score in (self.get_score(holder, tokens[i + 3])
+                                      for holder in self.holders(tokens[i + 2], x))) == expected]
+                    i += 6
+                elif tokens[i + 1] == "entity":
+                    contexts = [x for x in contexts if bool(self.select(tokens[i + 2], x)) == expected]
+                    i += 3
+                else:
+                    raise ValueError(f"Unsupported execute condition {tokens[i + 1]}")
+            else:
+                raise ValueError(f"Unsupported execute subcommand {sub}")
+            if not contexts:
+                return
+
+    def run_scoreboard(self, tokens: list, context: Context):
+        if tokens[1] == "objectives":
+            if tokens[2] == "add":
+                self.objectives.setdefault(tokens[3], {})
+            elif tokens[2] == "remove":
+                self.objectives.pop(tokens[3], None)
+            return
+
+        action = tokens[2]
+        for holder in self.holders(tokens[3], context):
+            objective = tokens[4]
+            if action == "operation":
+                self.run_operation(holder, objective, tokens[5], tokens[6], tokens[7], context)
+            elif action == "set":
+                self.set_score(holder, objective, int(tokens[5]))
+            elif action == "add":
+                self.set_score(holder, objective, (self.get_score(holder, objective) or 0) + int(tokens[5]))
+            elif action == "remove":
+                self.set_score(holder, objective, (self.get_score(holder, objective) or 0) - int(tokens[5]))
+            elif action == "reset":
+                for scores in self.objectives.values() if objective == "*" else [self.objectives.get(objective, {})]:
+                    scores.pop(holder, None)
+
+    def run_operation(self, holder: str, objective: str, operation: str, source: str, source_objective: str,
+                      context: Context):
+        # An unset score makes the operation fail, as in game
+        target = self.get_score(holder, objective)
+        for source_holder in self.holders(source, context):
+            value = self.get_score(source_holder, source_objective)
+            if value is None or (target is None and operation != "="):
+                continue
+            if operation == "=":
+                target = value
+            elif operation == "+=":
+                target += value
+            elif operation == "-=":
+                target -= value
+            elif operation == "*=":
+                target *= value
+            elif operation == "/=" and value != 0:
+                target = math.floor(target / value)
+            elif operation == "%=" and value != 0:
+                target %= value
+            elif operation == "<":
+                target = min(target, value)
+            elif operation == ">":
+                target = max(target, value)
+            self.set_score(holder, objective, target)
+
+    def run_camera(self, tokens: list, context: Context):
+        # camera <players> set <preset> [ease <time> <type>] [pos <x y z>] [rot <x y>]
+        event = {"tick": self.tick_count, "preset": tokens[3], "ease": None,
+                 "position": None, "rotation": None}
+        i = 4
+        while i < len(tokens):
+            if tokens[i] == "ease":
+                event["ease"] = (float(tokens[i + 1]), tokens[i + 2])
+                i += 3
+            elif tokens[i] == "pos":
+                values, i = self.read_coordinates(tokens, i + 1, 3)
+                event["position"] = self.resolve_position(values, context)
+            elif tokens[i] == "rot":
+                values, i = self.read_coordinates(tokens, i + 1, 2)
+                event["rotation"] = self.resolve_rotation(values, context)
+            else:
+                i += 1
+        for player in self.select(tokens[1], context):
+            self.camera_events.append(dict(event, player=player.name))
+
+    def run_summon(self, tokens: list, context: Context):
+        position, rotation = context.position, context.rotation
+        if len(tokens) > 2:
+            values, i = self.read_coordinates(tokens, 2, 3)
+            position = self.resolve_position(values, context)
+            if i < len(tokens):
+                values, i = self.read_coordinates(tokens, i, 2)
+                rotation = self.resolve_rotation(values, context)
+        self.entities.append(Entity(f"{tokens[1]}#{len(self.entities)}", tokens[1], position, rotation,
+                                    self.families.get(tokens[1], ())))
+
+    # Arguments
+
+    def select(self, selector: str, context: Context) -> list:
+        if not selector.startswith("@"):
+            return [x for x in self.entities if x.name == selector]
+        kind = selector[1]
+        # family and tag may be repeated, every one of them has to match
+        arguments = []
+        if "[" in selector:
+            for argument in selector[selector.index("[") + 1:-1].split(","):
+                key, _, value = argument.strip().partition("=")
+                if key not in self.SELECTOR_ARGUMENTS:
+                    raise ValueError(f"Unsupported selector argument {key} in {selector}")
+                arguments.append((key, value.strip()))
+        single = dict(arguments)
+
+        if kind == "s":
+            entities = [context.executor] if context.executor is not None else []
+        elif kind in "ap":
+            entities = self.players()
+        else:
+            entities = list(self.entities)
+
+        def matches(value, actual):
+            # value or !value, where actual is a value or a set of values
+            negated = value.startswith("!")
+            value = value.lstrip("!")
+            found = value in actual if isinstance(actual, set) else value == actual
+            return found != negated
+
+        for key, value in arguments:
+            if key == "type":
+                entities = [x for x in entities if matches(value, x.type)]
+            elif key == "name":
+                entities = [x for x in entities if matches(value, x.name)]
+            elif key == "family":
+                entities = [x for x in entities if matches(value, x.families)]
+            elif key == "tag":
+                entities = [x for x in entities if matches(value, x.tags)]
+
+        origin = tuple(float(single[axis]) if axis in single else context.position[i]
+                       for i, axis in enumerate("xyz"))
+        if "r" in single:
+            entities = [x for x in entities if math.dist(x.position, origin) <= float(single["r"])]
+        if "rm" in single:
+            entities = [x for x in entities if math.dist(x.position, origin) >= float(single["rm"])]
+        if kind == "p" or "c" in single:
+            entities.sort(key=lambda x: math.dist(x.position, origin))
+            entities = entities[:int(single.get("c", 1))]
+        return entities
+
+    def holders(self, target: str, context: Context) -> list:
+        """Return the score holder names of a target: a selector or a fake player name."""
+        if target.startswith("@"):
+            return [x.name for x in self.select(target, context)]
+        return [target]
+
+    @staticmethod
+    def read_coordinates(tokens: list, i: int, count: int) -> tuple[list, int]:
+        """Read count coordinates starting at tokens[i], which may be written together as in ~~-0.8~ or ^^^9."""
+        values = []
+        while len(values) < count:
+            values += [x for x in COORDINATE_PATTERN.findall(tokens[i]) if x]
+            i += 1
+        return values, i
+
+    @staticmethod
+    def resolve_position(values: list, context: Context) -> tuple:
+        if values[0].startswith("^"):
+            left, up, forward = (float(x[1:] or 0) for x in values)
+            return local_to_world(context.position, context.rotation, left, up, forward)
+        return tuple(context.position[i] + float(x[1:] or 0) if x.startswith("~") else float(x)
+                     for i, x in enumerate(values))
+
+    @staticmethod
+    def resolve_rotation(values: list, context: Context) -> tuple:
+        return tuple(context.rotation[i] + float(x[1:] or 0) if x.startswith("~") else float(x)
+                     for i, x in enumerate(values))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run generated song functions without a game client.")
+    parser.add_argument("--bp", default="./BP", help="behavior pack directory")
+    parser.add_argument("--setup", action="append", default=[], help="function to run once before the first tick")
+    parser.add_argument("--score", action="append", default=[], help="objective=value to set for every player")
+    parser.add_argument("--players", type=int, default=1)
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--function", action="append", help="tick function, tick.json by default")
+    parser.add_argument("--tick-ms", type=float, default=50, help="wall clock milliseconds of a tick for song_clock.js")
+    parser.add_argument("--timeline", help="write the camera timeline and command counts to this JSON file")
+    args = parser.parse_args()
+
+    simulator = TickSimulator(os.path.join(args.bp, "functions"), tick_ms=args.tick_ms)
+    for i in range(args.players):
+        simulator.add_player(f"player{i}")
+    for name in args.setup:
+        simulator.run_function(name)
+    for score in args.score:
+        objective, value = score.split("=")
+        for player in simulator.players():
+            simulator.set_score(player.name, objective, int(value))
+
+    counts = simulator.run(args.ticks, args.function)
+    print(f"[INFO] {args.ticks} ticks, {len(simulator.camera_events)} camera events, "
+          f"{sum(counts) / max(len(counts), 1):.1f} commands per tick on average, {max(counts, default=0)} at most, "
+          f"{len(simulator.resyncs)} resyncs")
+    if simulator.ignored:
+        print(f"[INFO] Ignored commands: {simulator.ignored}")
+
+    if args.timeline:
+        with open(args.timeline, "w") as f:
+            json.dump({"commands_per_tick": counts, "camera": simulator.camera_events, "resyncs": simulator.resyncs},
+                      f, indent=4)